@@ -164,7 +164,7 @@ class Auv:
                 Z_shark_bearing = angle_wrap(math.atan2(delta_y, delta_x) - self.state.theta + bearing_random)
                 # updates new x, y here 
                 print("theta in auv", self.state.theta)
-                self.shark_sensor_data_list.append([shark_data.x, shark_data.y, self.state.theta, Z_shark_range, Z_shark_bearing,  shark_id])
+                self.shark_sensor_data_list.append([shark_data.x, shark_data.y, self.state.theta, Z_shark_range, Z_shark_bearing,  shark_id, self.state.x, self.state.y])
             
             # reset the 2 sec time counter
             self.sensor_time = 0
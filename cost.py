@@ -186,10 +186,14 @@ class Cost:
                     temp_time = time_bin
                     break
             sharkGrid = shark_dict[temp_time]
-            for cell_bound, prob in sharkGrid.items():
-                if mps.x >= cell_bound[0] and mps.x <= cell_bound[2] and mps.y >= cell_bound[1] and mps.x <= cell_bound[3]:
-                    cost[3] += w4 * prob
-                    break
+            if hasattr(sharkGrid, "value_at"):
+                # a DenseGridBin finds the cell by index arithmetic
+                cost[3] += w4 * float(sharkGrid.value_at(mps.x, mps.y))
+            else:
+                for cell_bound, prob in sharkGrid.items():
+                    if mps.x >= cell_bound[0] and mps.x <= cell_bound[2] and mps.y >= cell_bound[1] and mps.y <= cell_bound[3]:
+                        cost[3] += w4 * prob
+                        break
 
             for i in range(len(habitats)):
                 dist = math.sqrt((habitats[i].x-mps.x) **2 + (habitats[i].y-mps.y) **2)
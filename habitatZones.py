@@ -43,10 +43,10 @@ def velocity_wrap(velocity):
         return velocity_wrap(velocity)
 
 class Particle: 
-        def __init__(self, x_shark, y_shark):
+        def __init__(self, x_shark, y_shark, num_of_particles = 1000):
             #set L (side length of square that the random particles are in) and N (number of particles)
             INITIAL_PARTICLE_RANGE = 150
-            NUMBER_OF_PARTICLES = 1000
+            NUMBER_OF_PARTICLES = num_of_particles
             #particle has 5 properties: x, y, velocity, theta, weight (starts at 1/N)
             self.x_p = x_shark + random.uniform(-INITIAL_PARTICLE_RANGE, INITIAL_PARTICLE_RANGE)
             self.y_p = y_shark + random.uniform(-INITIAL_PARTICLE_RANGE, INITIAL_PARTICLE_RANGE)
@@ -424,108 +424,106 @@ class ParticleFilter:
     
 
 class HabitatZones: 
+    """
+    Probability that the shark is in each zone of a square grid around the origin
+
+    The zones are stored in a 2D numpy array, zones[row][col] is the probability of the zone,
+        row 0 is the top row (largest y) and col 0 is the left column (smallest x),
+        the label of a zone goes from top left to top right and then down a row, label = row * number of columns + col
+    """
     def __init__(self, grid_range, cell_size):
         # grid range is 150 m
         # boundary is the boundary of area that must be split into cells, has a min x/y and max x/y
         # cell size is 10m (length of each size)
         self.grid_range = grid_range
         self.cell_size = cell_size
-        
-        NUMBER_OF_ZONES = (self.grid_range/10)**2
+        # number of zones along each side of the grid
+        self.num_of_cells = int(math.ceil(self.grid_range * 2 / self.cell_size))
     
-    def create_zones(self, zone_width):
-        NUMBER_OF_PARTICLES = 1000
-        label = 0
-        #label should go from top left to top right and then down a row to repeat
-        minx = -self.grid_range
-        maxx = -self.grid_range + self.cell_size
-        miny = self.grid_range - self.cell_size
-        maxy = self.grid_range
-        probability = 1/NUMBER_OF_PARTICLES
-        zones = []
-        
-        zones = [[0 for x in range(int(math.ceil(self.grid_range * 2) / self.cell_size))] for y in range(int(math.ceil(self.grid_range * 2) / self.cell_size))]
-
-        for i in range(len(zones)):
-            for j in range(len(zones[0])):
-                zones[i][j] = [(minx, maxx), (miny, maxy), label, probability]
-                minx += 10
-                maxx += 10
-                if maxx >= int(self.grid_range +1):
-                    maxx = -self.grid_range + 10
-                    minx = -self.grid_range
-                #print(zones[i][j])
-                label += 1
-               
-            maxy += -10
-            miny += -10
-        return zones
+    def create_zones(self, zone_width, num_of_particles = 1000):
+        """
+        returns a 2D numpy array of zone probabilities, every zone starts at 1/num_of_particles
+        """
+        return np.full((self.num_of_cells, self.num_of_cells), 1/num_of_particles)
 
-    def indexToCell(self, x_p, y_p, zones):
-        #round x_p and y_p up to the nearest 10
-        if x_p > self.grid_range:
-            x_p = self.grid_range
-        if x_p < -self.grid_range:
-            x_p = -self.grid_range
-        if y_p > self.grid_range:
-            y_p = self.grid_range
-        if y_p < -self.grid_range:
-            y_p = -self.grid_range
-        NUMBER_OF_CELLS = (self.grid_range * 2) **2
-        maxx = int(math.ceil(x_p / 10.0)) * 10
-        maxy = int(math.ceil(y_p / 10.0)) * 10
-        maxx += self.grid_range
-        maxx = (maxx/self.cell_size) -1
-        maxy += -self.grid_range
-        maxy = (maxy/-self.cell_size) 
-        
-        #print(int(maxy), int(maxx))
-        return zones[int(maxy)][int(maxx)]
+    def indexToCell(self, x_p, y_p):
+        """
+        returns the (row, col) of the zone that contains each position, positions outside of the grid
+            are moved to the closest zone on the edge of the grid
 
-    def update_probability(self, particles, zones):
-        NUMBER_OF_PARTICLES = 1000
-        count = 0
-        for particle in particles: 
-            zone_number = self.indexToCell(particle.x_p, particle.y_p, zones)
-            zone_number[3] += 1/NUMBER_OF_PARTICLES
-            count +=1
-            #print(count)
-        
+        Parameter:
+            x_p, y_p - numbers or numpy arrays of positions
+        """
+        #round x_p and y_p up to the nearest cell
+        x_p = np.clip(x_p, -self.grid_range, self.grid_range)
+        y_p = np.clip(y_p, -self.grid_range, self.grid_range)
+        col = (np.ceil(x_p / self.cell_size) * self.cell_size + self.grid_range) / self.cell_size - 1
+        row = (np.ceil(y_p / self.cell_size) * self.cell_size - self.grid_range) / -self.cell_size
+        # -grid_range itself would be in column -1 and row num_of_cells
+        col = np.clip(col, 0, self.num_of_cells - 1).astype(int)
+        row = np.clip(row, 0, self.num_of_cells - 1).astype(int)
+        return row, col
+
+    def zone_label(self, row, col):
+        """returns the label of the zone at (row, col)"""
+        return row * self.num_of_cells + col
+
+    def zone_bounds(self, label):
+        """returns [(minx, maxx), (miny, maxy)] of the zone with the given label"""
+        row, col = divmod(label, self.num_of_cells)
+        minx = -self.grid_range + col * self.cell_size
+        maxy = self.grid_range - row * self.cell_size
+        return [(minx, minx + self.cell_size), (maxy - self.cell_size, maxy)]
+
+    def get_zone(self, x, y, zones):
+        """returns [label, probability] of the zone that contains the position (x, y)"""
+        row, col = self.indexToCell(x, y)
+        return [int(self.zone_label(row, col)), float(zones[row, col])]
+
+    def most_likely_zone(self, zones):
+        """returns [label, probability] of the zone with the highest probability"""
+        label = int(np.argmax(zones))
+        return [label, float(zones.flat[label])]
+
+    def update_probability(self, particles, zones, weights = None):
+        """
+        adds the particles to the zones with a single weighted 2D histogram
+
+        Parameter:
+            particles - a ParticleSet or a list of particle objects
+            zones - 2D numpy array of zone probabilities, it is updated in place
+            weights - (optional) how much each particle adds to its zone, 
+                defaults to 1/number of particles for every particle
+        """
+        x_p, y_p = self.particle_positions(particles)
+        if weights is None:
+            # the particle filter can change its number of particles, so use the live count
+            weights = np.full(len(x_p), 1/len(x_p))
+        row, col = self.indexToCell(x_p, y_p)
+        zones += np.bincount(self.zone_label(row, col), weights = weights, minlength = zones.size).reshape(zones.shape)
         return zones
+
+    def particle_positions(self, particles):
+        """returns the x and y positions of the particles as two flat numpy arrays"""
+        if isinstance(particles, list):
+            return np.array([particle.x_p for particle in particles], dtype = float), np.array([particle.y_p for particle in particles], dtype = float)
+        return np.ravel(particles.x_p), np.ravel(particles.y_p)
     
     def normalize_probability(self, zones):
-        denominator = 0
-        NUMBER_OF_ZONES = (self.grid_range/10)**2
-        for zone in zones: 
-            for cell in zone:
-                denominator += cell[3]
-        for zone in zones: 
-            for cell in zone:
-                cell[3] = cell[3]/denominator
+        zones /= zones.sum()
         return zones
 
     def devalue_probability(self, zones):
-        #print(zones)
-        for zone in zones: 
-            for cell in zone:
-                if float(cell[3]) < .1: 
-                    cell[3] += -.005
-                elif float(cell[3]) < .5: 
-                    cell[3] += -.01
-                elif float(cell[3]) < 1: 
-                    cell[3] += -.05
-                if float(cell[3]) < 0: 
-                    cell[3] = 0
+        zones -= np.select([zones < .1, zones < .5, zones < 1], [.005, .01, .05], 0)
+        np.maximum(zones, 0, out = zones)
         return zones
 
     def main_zone_function(self, particles, zones):
         self.devalue_probability(zones)
-        #print("is anything happening")
         
         self.update_probability(particles, zones)
         
         self.normalize_probability(zones)
-        #print("did i work")
         return zones
 
 
@@ -540,7 +538,6 @@ def main():
     final_time_list = []
     for i in range(num_of_loops):
         NUMBER_OF_PARTICLES = 1000
-        #change this constant ^^ in the particle class too!
         particles = []
         #test_grapher = Live3DGraph()
         #test_grapher_shark = Figure()
@@ -587,11 +584,11 @@ def main():
         grid_range = 150
         cell_size = 10 
         habitat_grid = HabitatZones(grid_range, cell_size)
-        zones = habitat_grid.create_zones(cell_size)
+        zones = habitat_grid.create_zones(cell_size, NUMBER_OF_PARTICLES)
         
         
         for x in range(0, NUMBER_OF_PARTICLES):
-            new_particle = Particle(shark_1.x_shark, shark_1.y_shark)
+            new_particle = Particle(shark_1.x_shark, shark_1.y_shark, NUMBER_OF_PARTICLES)
             particles.append(new_particle)
         
         test_particle.create_and_update(particles)
@@ -262,36 +262,25 @@ class Live3DGraph:
         Plot the particles if the the particle checkbox is checked
 
         Parameter:
-            particle_array - an array of arrays, where each element has the format:
-                [x_p, y_p, v_p, theta_p, weight_p]
+            particle_coordinates - a ParticleSet, where x_p, y_p and weight_p are numpy arrays
+                (the particles of every shark are plotted when the arrays have one row per shark)
         """
         if self.display_particles:
-            particle_x_array = []
-            particle_y_array = []
-            particle_color_array = []
             # create two arrays for plotting x and y positions
-            for particle in particle_coordinates:
-                particle_x_array.append(particle.x_p)
-                particle_y_array.append(particle.y_p)
-                # particle[4] specify the weight of the points
-                # the color of particles based on high weight to low weight:
-                #   red -> orange -> purple -> blue
-                if particle.weight_p > 0.75 and particle.weight_p <= 1.0:
-                    # red
-                    particle_color_array.append('#e31263')
-                elif particle.weight_p > 0.5 and particle.weight_p <= 0.75:
-                    # orange
-                    particle_color_array.append('#912951')
-                elif particle.weight_p > 0.25 and particle.weight_p <= 0.5:
-                    # purple
-                    particle_color_array.append('#7a5b67')
-                else:
-                    # blue
-                    particle_color_array.append('#786b70')
+            particle_x_array = np.ravel(particle_coordinates.x_p)
+            particle_y_array = np.ravel(particle_coordinates.y_p)
+            # weights are compared relative to the heaviest particle
+            weight_p = np.ravel(particle_coordinates.weight_p) / np.max(particle_coordinates.weight_p)
+            # the color of particles based on high weight to low weight:
+            #   red -> orange -> purple -> blue
+            particle_color_array = np.select([(weight_p > 0.75) & (weight_p <= 1.0), (weight_p > 0.5) & (weight_p <= 0.75), (weight_p > 0.25) & (weight_p <= 0.5)],\
+                ['#e31263', '#912951', '#7a5b67'], '#786b70')
 
             # TODO: for now, we set the z position of the trajectory to be -10
 
-            self.ax.scatter(particle_x_array, particle_y_array, -10, marker = 'o', color = particle_color_array)
+            # the number of particles changes when the particle filter is adaptive
+            self.ax.scatter(particle_x_array, particle_y_array, -10, marker = 'o', color = particle_color_array,\
+                label = str(len(particle_x_array)) + " particles")
             """
             self.ax.set_xlim3d(-75,75)
             self.ax.set_ylim3d(-175,175)
@@ -0,0 +1,179 @@
+"""
+Record and replay the range & bearing measurements that the particle filter gets
+
+A log is a small header followed by fixed size binary records (MEASUREMENT_DTYPE), one record per
+    (time, auv, shark) measurement, so a recorded mission can be pushed through the particle filter again
+    with different settings, without simulating the auvs and the sharks
+"""
+import argparse
+
+import numpy as np
+
+from particleFilter import MultiSharkParticleFilter
+from motion_plan_state import Motion_plan_state
+
+LOG_MAGIC = b"SHARKLOG"
+LOG_VERSION = 1
+MEASUREMENT_DTYPE = np.dtype([
+    ("time", "<f8"),
+    ("auv_id", "<i4"),
+    ("auv_x", "<f8"),
+    ("auv_y", "<f8"),
+    ("auv_theta", "<f8"),
+    ("shark_id", "<i4"),
+    ("range", "<f8"),
+    ("bearing", "<f8"),
+    # actual position of the shark, only used to calculate the error of the filter (nan if unknown)
+    ("shark_x", "<f8"),
+    ("shark_y", "<f8"),
+])
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("record_size", "<u4")])
+
+
+class MeasurementRecorder:
+    """
+    Appends measurements to a binary log file, can be used in a with statement
+    """
+    def __init__(self, path):
+        self.log_file = open(path, "wb")
+        np.array([(LOG_MAGIC, LOG_VERSION, MEASUREMENT_DTYPE.itemsize)], dtype = HEADER_DTYPE).tofile(self.log_file)
+
+    def record(self, curr_time, auv_id, list_of_range_bearing):
+        """
+        Parameter:
+            curr_time - time of the measurements
+            auv_id - id of the auv that took the measurements
+            list_of_range_bearing - list of measurements returned by Auv.get_all_sharks_sensor_measurements
+                [shark_data.x, shark_data.y, auv theta, Z_shark_range, Z_shark_bearing, shark_id, auv x, auv y]
+        """
+        records = np.array([(curr_time, auv_id, auv_x, auv_y, auv_theta, shark_id, shark_range, shark_bearing, shark_x, shark_y)\
+            for shark_x, shark_y, auv_theta, shark_range, shark_bearing, shark_id, auv_x, auv_y in list_of_range_bearing], dtype = MEASUREMENT_DTYPE)
+        records.tofile(self.log_file)
+
+    def record_all(self, curr_time, auv_ids, measurement_dict_list):
+        """
+        records the measurements of every auv at the same time
+
+        Parameter:
+            auv_ids - list of auv ids, in the same order as measurement_dict_list
+            measurement_dict_list - one list of measurements per auv
+        """
+        for auv_id, list_of_range_bearing in zip(auv_ids, measurement_dict_list):
+            self.record(curr_time, auv_id, list_of_range_bearing)
+
+    def close(self):
+        self.log_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_measurement_log(path):
+    """returns every record of the log as a numpy structured array (MEASUREMENT_DTYPE)"""
+    with open(path, "rb") as log_file:
+        header = np.fromfile(log_file, dtype = HEADER_DTYPE, count = 1)
+        if len(header) == 0 or header[0]["magic"] != LOG_MAGIC:
+            raise ValueError(path + " is not a measurement log")
+        if header[0]["version"] != LOG_VERSION or header[0]["record_size"] != MEASUREMENT_DTYPE.itemsize:
+            raise ValueError(path + " was written by an incompatible version of the measurement log")
+        return np.fromfile(log_file, dtype = MEASUREMENT_DTYPE)
+
+def split_by_time(records):
+    """returns a list of (time, records) pairs, one for every time in the log, in order"""
+    order = np.argsort(records["time"], kind = "stable")
+    sorted_times = records["time"][order]
+    times = np.unique(sorted_times)
+    boundaries = np.append(np.searchsorted(sorted_times, times), len(records))
+    return [(time, records[order[start:end]]) for time, start, end in zip(times, boundaries[:-1], boundaries[1:])]
+
+def to_measurement_list(records):
+    """returns the records as measurement lists, [shark x, shark y, auv theta, range, bearing, shark id, auv x, auv y]"""
+    return [[float(record["shark_x"]), float(record["shark_y"]), float(record["auv_theta"]), float(record["range"]),\
+        float(record["bearing"]), int(record["shark_id"]), float(record["auv_x"]), float(record["auv_y"])] for record in records]
+
+def replay(records, test_particle, dt = 0.1, shark_id = None):
+    """
+    pushes the recorded measurements through a particle filter, one filter update per recorded time,
+        the particles are moved in steps of dt up to every recorded time (one dt before the first one), like ParticleFilterWorker
+
+    returns a dictionary of numpy arrays:
+        times - (number of times)
+        estimates - (number of times, number of sharks, 2) estimated x and y of every shark
+        errors - (number of times, number of sharks) distance between the estimate and the last recorded position of the shark,
+            nan until the shark has a recorded position
+
+    Parameter:
+        records - numpy structured array returned by read_measurement_log
+        test_particle - a ParticleFilter or MultiSharkParticleFilter, give it a seeded rng to make the replay repeatable
+        dt - (optional) length (sec) of one motion step of the particles, also how long they move before the first update
+        shark_id - (optional) the shark that a single shark ParticleFilter tracks, defaults to the first shark of the log
+    """
+    multi_shark = isinstance(test_particle, MultiSharkParticleFilter)
+    if not multi_shark:
+        shark_id = int(records["shark_id"][0]) if shark_id is None else shark_id
+        records = records[records["shark_id"] == shark_id]
+    shark_ids = test_particle.shark_ids if multi_shark else [shark_id]
+    shark_row = {shark_id: row for row, shark_id in enumerate(shark_ids)}
+    # last recorded position of every shark, the estimates are compared against it
+    shark_x = np.full(len(shark_ids), np.nan)
+    shark_y = np.full(len(shark_ids), np.nan)
+    particles = test_particle.create()
+
+    times = []
+    estimates = []
+    errors = []
+    previous_time = None
+    for curr_time, time_records in split_by_time(records):
+        particles = test_particle.propagate(particles, dt if previous_time is None else curr_time - previous_time, dt)
+        previous_time = curr_time
+        known = ~np.isnan(time_records["shark_x"]) & ~np.isnan(time_records["shark_y"])
+        rows = np.array([shark_row[int(record_shark_id)] for record_shark_id in time_records["shark_id"][known]], dtype = int)
+        shark_x[rows] = time_records["shark_x"][known]
+        shark_y[rows] = time_records["shark_y"][known]
+        if multi_shark:
+            # one list of measurements per auv
+            list_of_range_bearing = [to_measurement_list(time_records[time_records["auv_id"] == auv_id]) for auv_id in np.unique(time_records["auv_id"])]
+        else:
+            list_of_range_bearing = to_measurement_list(time_records)
+        particles = test_particle.update_weights(particles, list_of_range_bearing)
+
+        x_mean, y_mean = test_particle.particleMean(particles)
+        times.append(curr_time)
+        estimates.append(np.column_stack((x_mean, y_mean)))
+        errors.append(np.hypot(x_mean - shark_x, y_mean - shark_y))
+    return {"times": np.array(times), "estimates": np.array(estimates).reshape(len(times), -1, 2), "errors": np.array(errors).reshape(len(times), -1)}
+
+def replay_log(path, seed = 0, **filter_arguments):
+    """
+    replays a log through a new MultiSharkParticleFilter that starts at the first recorded position of every shark,
+        the same seed always gives the same result
+
+    Parameter:
+        filter_arguments - (optional) passed on to MultiSharkParticleFilter, eg num_of_particles
+    """
+    records = read_measurement_log(path)
+    shark_state_dict = {}
+    for record in records:
+        if int(record["shark_id"]) not in shark_state_dict:
+            shark_state_dict[int(record["shark_id"])] = Motion_plan_state(float(record["shark_x"]), float(record["shark_y"]))
+    test_particle = MultiSharkParticleFilter(shark_state_dict, [], rng = np.random.default_rng(seed), **filter_arguments)
+    return replay(records, test_particle)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "replay a measurement log through the particle filter")
+    parser.add_argument("log")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--particles", type = int, default = 1000)
+    args = parser.parse_args()
+
+    results = replay_log(args.log, args.seed, num_of_particles = args.particles)
+    print("replayed", len(results["times"]), "updates")
+    print("final error of every shark:", results["errors"][-1])
+    print("mean error of every shark:", np.nanmean(results["errors"], axis = 0))
+
+if __name__ == "__main__":
+    main()
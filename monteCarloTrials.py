@@ -0,0 +1,179 @@
+"""
+Headless Monte Carlo runner for particle filter convergence studies
+
+Every trial simulates a shark swimming in a straight line and AUVs that measure its range & bearing,
+    then runs a ParticleFilter on the measurements and records the distance between the estimated and actual shark position.
+The trials of every configuration run in a process pool, each one with its own random number generator
+    spawned from a single seed, so the results do not depend on how the trials are spread over the processes.
+
+All of the results are saved to one .npz file:
+    times - (number of steps) simulation time of every step
+    errors - (number of configurations, number of trials, number of steps) error of the filter at every step
+    convergence_time - (number of configurations, number of trials) first time after which the error stays
+        below the convergence error, nan if the filter never converges
+    num_of_particles, sigma_range, sigma_alpha, range_noise, bearing_noise - (number of configurations) the configurations
+    seed - the seed that all of the trials were spawned from
+"""
+import argparse
+import itertools
+import math
+import multiprocessing
+
+import numpy as np
+
+from particleFilter import ParticleFilter
+
+# parameters that are the same for every trial
+DEFAULT_TRIAL = {
+    "num_of_steps": 400,
+    "dt": 0.1,
+    # a new set of measurements every measurement_interval steps
+    "measurement_interval": 1,
+    # initial position and (constant) velocity of the shark
+    "shark_start": (5.0, 5.0),
+    "shark_velocity": (1.0, 1.0),
+    # stationary auvs, (x, y, theta)
+    "auv_list": [(0.0, 0.0, 0.0), (-10.0, 10.0, 0.0)],
+    "convergence_error": 10.0,
+}
+
+def make_configurations(num_of_particles_list, sigma_range_list, sigma_alpha_list, range_noise_list, bearing_noise_list):
+    """
+    returns a list of configuration dictionaries, one for every combination of the given values
+    """
+    return [{"num_of_particles": num_of_particles, "sigma_range": sigma_range, "sigma_alpha": sigma_alpha,\
+        "range_noise": range_noise, "bearing_noise": bearing_noise}\
+        for num_of_particles, sigma_range, sigma_alpha, range_noise, bearing_noise\
+        in itertools.product(num_of_particles_list, sigma_range_list, sigma_alpha_list, range_noise_list, bearing_noise_list)]
+
+def convergence_time(errors, times, convergence_error):
+    """
+    returns the first time after which every error is below convergence_error, nan if the last error is not
+
+    Parameter:
+        errors - numpy array of the filter's error at every step
+        times - numpy array of the time of every step
+    """
+    above = np.flatnonzero(errors >= convergence_error)
+    if len(above) == 0:
+        return times[0]
+    if above[-1] == len(errors) - 1:
+        return np.nan
+    return times[above[-1] + 1]
+
+def run_trial(configuration, seed_sequence, trial = DEFAULT_TRIAL):
+    """
+    runs one particle filter trial and returns the error of the filter at every step
+
+    Parameter:
+        configuration - a dictionary made by make_configurations
+        seed_sequence - numpy SeedSequence of this trial, both the measurement noise and the filter use it
+        trial - (optional) a dictionary with the same keys as DEFAULT_TRIAL
+    """
+    rng = np.random.default_rng(seed_sequence)
+    x_shark, y_shark = trial["shark_start"]
+    v_x_shark, v_y_shark = trial["shark_velocity"]
+    auv_array = np.array(trial["auv_list"], dtype = float)
+
+    test_particle = ParticleFilter(x_shark, y_shark, [], num_of_particles = configuration["num_of_particles"], rng = rng)
+    test_particle.SIGMA_RANGE = configuration["sigma_range"]
+    test_particle.SIGMA_ALPHA = configuration["sigma_alpha"]
+    particles = test_particle.create()
+
+    errors = np.empty(trial["num_of_steps"])
+    for step in range(trial["num_of_steps"]):
+        x_shark += v_x_shark * trial["dt"]
+        y_shark += v_y_shark * trial["dt"]
+        particles = test_particle.create_and_update(particles, trial["dt"])
+
+        if step % trial["measurement_interval"] == 0:
+            delta_x = x_shark - auv_array[:, 0]
+            delta_y = y_shark - auv_array[:, 1]
+            auv_range = np.hypot(delta_x, delta_y) + rng.normal(0, configuration["range_noise"], len(auv_array))
+            auv_bearing = np.arctan2(delta_y, delta_x) - auv_array[:, 2] + rng.normal(0, configuration["bearing_noise"], len(auv_array))
+            list_of_range_bearing = [[x_shark, y_shark, theta, r, math.remainder(bearing, 2 * math.pi), 1, x, y]\
+                for (x, y, theta), r, bearing in zip(auv_array, auv_range, auv_bearing)]
+            particles = test_particle.update_weights(particles, list_of_range_bearing)
+
+        x_mean, y_mean = test_particle.particleMean(particles)
+        errors[step] = math.hypot(x_mean - x_shark, y_mean - y_shark)
+    return errors
+
+def _run_trial_job(job):
+    """unpacks a (configuration index, configuration, seed sequence, trial) tuple for the process pool"""
+    configuration_index, configuration, seed_sequence, trial = job
+    return configuration_index, run_trial(configuration, seed_sequence, trial)
+
+def run_experiment(configurations, num_of_trials, seed = 0, trial = DEFAULT_TRIAL, num_of_processes = None):
+    """
+    runs num_of_trials trials of every configuration in a process pool
+
+    returns a dictionary of numpy arrays, described at the top of this file
+
+    Parameter:
+        configurations - a list of dictionaries made by make_configurations
+        num_of_trials - number of trials of each configuration
+        seed - (optional) every trial gets its own random stream spawned from this seed
+        trial - (optional) a dictionary with the same keys as DEFAULT_TRIAL
+        num_of_processes - (optional) size of the process pool, defaults to the number of cpus
+    """
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(configurations) * num_of_trials)
+    jobs = [(configuration_index, configuration, seed_sequences[configuration_index * num_of_trials + trial_index], trial)\
+        for configuration_index, configuration in enumerate(configurations) for trial_index in range(num_of_trials)]
+
+    errors = np.empty((len(configurations), num_of_trials, trial["num_of_steps"]))
+    trial_count = np.zeros(len(configurations), dtype = int)
+    with multiprocessing.Pool(num_of_processes) as pool:
+        # the results come back in the same order as the jobs
+        for configuration_index, trial_errors in pool.imap(_run_trial_job, jobs, chunksize = max(1, len(jobs) // (4 * (num_of_processes or multiprocessing.cpu_count())))):
+            errors[configuration_index, trial_count[configuration_index]] = trial_errors
+            trial_count[configuration_index] += 1
+
+    times = (np.arange(trial["num_of_steps"]) + 1) * trial["dt"]
+    results = {"times": times, "errors": errors,\
+        "convergence_time": np.array([[convergence_time(trial_errors, times, trial["convergence_error"]) for trial_errors in configuration_errors]\
+            for configuration_errors in errors]),\
+        "seed": np.array(seed)}
+    for key in ["num_of_particles", "sigma_range", "sigma_alpha", "range_noise", "bearing_noise"]:
+        results[key] = np.array([configuration[key] for configuration in configurations])
+    return results
+
+def save_results(path, results):
+    """saves the dictionary returned by run_experiment to a .npz file"""
+    np.savez_compressed(path, **results)
+
+def summarize(results):
+    """prints the final error and the time to convergence of every configuration"""
+    for index in range(len(results["num_of_particles"])):
+        final_errors = results["errors"][index, :, -1]
+        times = results["convergence_time"][index]
+        converged = ~np.isnan(times)
+        print("particles:", results["num_of_particles"][index], " sigma range:", results["sigma_range"][index],\
+            " sigma alpha:", results["sigma_alpha"][index], " range noise:", results["range_noise"][index],\
+            " bearing noise:", results["bearing_noise"][index])
+        print("    final error mean:", np.mean(final_errors), " median:", np.median(final_errors),\
+            " converged:", np.count_nonzero(converged), "/", len(times),\
+            " time to convergence median:", np.median(times[converged]) if converged.any() else np.nan)
+
+def main():
+    parser = argparse.ArgumentParser(description = "run particle filter convergence trials in parallel")
+    parser.add_argument("--particles", type = int, nargs = "+", default = [1000])
+    parser.add_argument("--sigma-range", type = float, nargs = "+", default = [ParticleFilter.SIGMA_RANGE])
+    parser.add_argument("--sigma-alpha", type = float, nargs = "+", default = [ParticleFilter.SIGMA_ALPHA])
+    parser.add_argument("--range-noise", type = float, nargs = "+", default = [5.0])
+    parser.add_argument("--bearing-noise", type = float, nargs = "+", default = [0.5])
+    parser.add_argument("--trials", type = int, default = 20)
+    parser.add_argument("--steps", type = int, default = DEFAULT_TRIAL["num_of_steps"])
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--processes", type = int, default = None)
+    parser.add_argument("--output", default = "monte_carlo_results.npz")
+    args = parser.parse_args()
+
+    configurations = make_configurations(args.particles, args.sigma_range, args.sigma_alpha, args.range_noise, args.bearing_noise)
+    trial = dict(DEFAULT_TRIAL, num_of_steps = args.steps)
+    results = run_experiment(configurations, args.trials, args.seed, trial, args.processes)
+    save_results(args.output, results)
+    summarize(results)
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,8 @@ class Motion_plan_state:
         self.path = []
         self.length = 0
         self.cost = []
+        # cost.PathCost of the path from the root of an RRT tree to this state, without the state itself
+        self.prefix_cost = None
 
 
     def __repr__(self):
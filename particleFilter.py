@@ -14,6 +14,7 @@ import threading
 from live3DGraph import Live3DGraph
 from twoDfigure import Figure
 from motion_plan_state import Motion_plan_state
+from resampling import resample, effective_sample_size, kld_sample_size, count_occupied_bins
 
 def angle_wrap(ang):
     """
@@ -40,131 +41,170 @@ def velocity_wrap(velocity):
         velocity += -5
         return velocity_wrap(velocity)
 
-class Particle: 
-        def __init__(self, x_shark, y_shark):
-            #set L (side length of square that the random particles are in) and N (number of particles)
-            INITIAL_PARTICLE_RANGE = 150
-            NUMBER_OF_PARTICLES = 1000
-            #particle has 5 properties: x, y, velocity, theta, weight (starts at 1/N)
-            self.x_p = x_shark + random.uniform(-INITIAL_PARTICLE_RANGE, INITIAL_PARTICLE_RANGE)
-            self.y_p = y_shark + random.uniform(-INITIAL_PARTICLE_RANGE, INITIAL_PARTICLE_RANGE)
-            self.v_p = random.uniform(0, 5)
-            self.theta_p = random.uniform(-math.pi, math.pi)
-            self.weight_p = 1/NUMBER_OF_PARTICLES
-
-        def update_particle(self, dt):
-            """
-                updates the particles location with random v and theta
-
-                input (dt) is the amount of time the particles are "moving" 
-                    generally set to .1, but it should be whatever the "time.sleep" is set to in the main loop
-
-            """
-            #random_v and random_theta are values to be added to the velocity and theta for randomization
-            RANDOM_VELOCITY = 5
-            RANDOM_THETA = math.pi/2
-            #change velocity & pass through velocity_wrap
-            self.v_p += random.uniform(0, RANDOM_VELOCITY)
-            self.v_p = velocity_wrap(self.v_p)
-            #change theta & pass through angle_wrap
-            self.theta_p += random.uniform(-RANDOM_THETA, RANDOM_THETA)
-            self.theta_p = angle_wrap(self.theta_p)
-            #change x & y coordinates to match 
-            self.x_p += self.v_p * math.cos(self.theta_p) * dt
-            self.y_p += self.v_p * math.sin(self.theta_p) * dt
-            
-            
-        def calc_particle_alpha(self, x_auv, y_auv, theta_auv):
-            """
-                calculates the alpha value of a particle
-            """
-            particleAlpha = angle_wrap(math.atan2((-y_auv + self.y_p), (self.x_p + -x_auv)) - theta_auv)
-            return particleAlpha
-
-        def calc_particle_range(self, x_auv, y_auv):
-            """
-                calculates the range from the particle to the auv
-            """
-            particleRange_squared = math.sqrt((y_auv - self.y_p)**2 + (x_auv - self.x_p)**2)
-            return particleRange_squared
-
-        def weight(self, auv_alpha, particleAlpha, auv_range, particleRange):
-            """
-                calculates the weight according to alpha, then the weight according to range
-                they are multiplied together to get the final weight
-            """
-            #alpha weight
-            SIGMA_ALPHA = 0.5
-            constant = 1.2533141375
-            MINIMUM_WEIGHT = .001
-            if particleAlpha > 0:
-                function_alpha = .001 + (1/(constant)* (math.e**(((-((angle_wrap(float(particleAlpha) - auv_alpha)**2))))/(0.5))))
-                self.weight_p = function_alpha
-            elif particleAlpha == 0:
-                function_alpha = .001 + (1/(constant)* (math.e**(((-((angle_wrap(float(particleAlpha) - auv_alpha)**2))))/(0.5))))
-                self.weight_p = function_alpha
-            else:
-                function_alpha = .001 + (1/( constant)* (math.e**(((-((angle_wrap(float(particleAlpha) - auv_alpha)**2))))/(0.5))))
-                self.weight_p = function_alpha
-    
-            #range weight
-            SIGMA_RANGE = 100
+def angle_wrap_array(ang):
+    """
+    Vectorized version of angle_wrap, sets every angle in a numpy array between the range of -pi to pi
+
+    Parameter:
+        ang - numpy array of angles in radians
+    """
+    return np.mod(ang + math.pi, 2 * math.pi) - math.pi
+
+def velocity_wrap_array(velocity):
+    """
+    Vectorized version of velocity_wrap, keeps every velocity in a numpy array between 0 and 5
+
+    Parameter:
+        velocity - numpy array of velocities
+    """
+    return np.where(velocity > 5, velocity - 5 * np.ceil((velocity - 5) / 5), velocity)
+
+def log_sum_exp(log_values, axis = -1):
+    """
+    Calculates log(sum(exp(log_values))) along an axis without overflowing or underflowing,
+        by factoring out the largest value before exponentiating
+
+    Parameter:
+        log_values - numpy array of values in the log domain
+        axis - (optional) the axis to sum over, the result keeps it with length 1
+    """
+    max_value = np.max(log_values, axis = axis, keepdims = True)
+    # rows that are entirely -inf would give nan, so they are shifted by 0 instead
+    max_value = np.where(np.isfinite(max_value), max_value, 0)
+    return max_value + np.log(np.sum(np.exp(log_values - max_value), axis = axis, keepdims = True))
+
+def normalize_log_weights(log_weights, axis = -1):
+    """
+    Turns unnormalized log weights into linear weights that sum to 1 along an axis
+
+    Parameter:
+        log_weights - numpy array of particle weights in the log domain
+    """
+    return np.exp(log_weights - log_sum_exp(log_weights, axis))
+
+
+class ParticleSet:
+    """
+    Struct-of-arrays storage for the particles of a particle filter
+        each property of the particles (x, y, velocity, theta, weight) is stored in its own numpy array,
+        so the filter can update all of the particles with whole-array operations
+
+    The arrays are either shaped (number of particles) for a single shark,
+        or (number of sharks, number of particles) when several sharks are tracked at once
+    """
+    def __init__(self, x_p, y_p, v_p, theta_p, weight_p):
+        self.x_p = x_p
+        self.y_p = y_p
+        self.v_p = v_p
+        self.theta_p = theta_p
+        self.weight_p = weight_p
+
+    def __len__(self):
+        # number of particles (per shark)
+        return self.x_p.shape[-1]
 
-            function_weight =  MINIMUM_WEIGHT + (1/(SIGMA_RANGE * constant)* (math.e**(((-((particleRange - auv_range)**2)))/(20000))))
-            
-            #multiply weights
-            self.weight_p = function_weight * self.weight_p
+    def select(self, indices):
+        """
+        Return a new ParticleSet made out of the particles at the given indices
+
+        Parameter:
+            indices - numpy array of integers, an index can show up more than once
+                (or a tuple of (row, index) arrays when there is one row of particles per shark)
+        """
+        return ParticleSet(self.x_p[indices], self.y_p[indices], self.v_p[indices], self.theta_p[indices], self.weight_p[indices])
+
+    def select_rows(self, rows, indices):
+        """
+        Replace the particles of the given rows (sharks) in place with the particles at the given per-row indices
+
+        Parameter:
+            rows - numpy array of row numbers
+            indices - 2D numpy array of particle indices, one row for each element of rows
+        """
+        for name in ["x_p", "y_p", "v_p", "theta_p", "weight_p"]:
+            array = getattr(self, name)
+            array[rows] = np.take_along_axis(array[rows], indices, axis = 1)
 
 
 class ParticleFilter:
     # 2 sets of initial data- shark's initial position and velocity, and position of AUV 
     # output- estimates the sharks position and velocity
-    def __init__(self, init_x_shark, init_y_shark, init_auv_list):
-        "how you create an object out of the particle Filter class i.e. "
+
+    # side length of the square that the initial particles are in (m)
+    INITIAL_PARTICLE_RANGE = 150
+    # amount of randomization added to the velocity and theta of the particles every update
+    RANDOM_VELOCITY = 5
+    RANDOM_THETA = math.pi/2
+    # parameters of the range & bearing likelihood
+    SIGMA_ALPHA = 0.5
+    SIGMA_RANGE = 100
+    MINIMUM_WEIGHT = .001
+    CONSTANT = 1.2533141375
+    # parameters of the KLD-sampling bound that picks the number of particles
+    KLD_EPSILON = 0.05
+    KLD_Z_QUANTILE = 2.326
+    KLD_BIN_SIZE = 10
+
+    def __init__(self, init_x_shark, init_y_shark, init_auv_list, num_of_particles = 1000, resample_method = "systematic", resample_threshold = 0.5,\
+        min_particles = None, max_particles = None, rng = None):
+        """
+        how you create an object out of the particle Filter class
+
+        Parameter:
+            num_of_particles - (optional) number of particles that the filter starts with
+            resample_method - (optional) "systematic", "stratified" or "residual"
+            resample_threshold - (optional) the particles are only resampled when the effective sample size
+                drops below resample_threshold * number of particles
+            min_particles, max_particles - (optional) when they are different, the number of particles is picked
+                with KLD-sampling every time the particles are resampled: many particles while the estimate is spread out,
+                few once the particles converge. Both default to num_of_particles, which keeps the count fixed
+            rng - (optional) random number generator (numpy Generator) used for every random draw of the filter,
+                defaults to the global numpy random module
+        """
         self.x_shark = init_x_shark
         self.y_shark = init_y_shark
         self.auv_list = init_auv_list
+        # the live number of particles, it changes when the filter is adaptive
+        self.num_of_particles = num_of_particles
+        self.min_particles = num_of_particles if min_particles is None else min_particles
+        self.max_particles = num_of_particles if max_particles is None else max_particles
+        self.resample_method = resample_method
+        self.resample_threshold = resample_threshold
+        self.rng = random if rng is None else rng
+
+    def calc_particle_alpha(self, particles, x_auv, y_auv, theta_auv):
+        """
+            calculates the alpha value of every particle
+
+            x_auv, y_auv and theta_auv can either be numbers or arrays shaped (number of auvs, 1),
+                in which case the result has one row per auv
+        """
+        return angle_wrap_array(np.arctan2(particles.y_p - y_auv, particles.x_p - x_auv) - theta_auv)
+
+    def calc_particle_range(self, particles, x_auv, y_auv):
+        """
+            calculates the range from every particle to the auv
+        """
+        return np.hypot(particles.x_p - x_auv, particles.y_p - y_auv)
+
+    def log_weight(self, auv_alpha, particleAlpha, auv_range, particleRange):
+        """
+            calculates the log of the alpha weight plus the log of the range weight,
+                where each weight is MINIMUM_WEIGHT plus a gaussian of the alpha or range error
+
+            the exponentials are never evaluated directly, so a particle far from the measurement
+                gets a large negative log weight instead of a weight that underflows to 0
+        """
+        log_minimum = math.log(self.MINIMUM_WEIGHT)
+        #alpha weight
+        log_alpha = np.logaddexp(log_minimum, -math.log(self.CONSTANT) - (angle_wrap_array(particleAlpha - auv_alpha)**2) / (2 * self.SIGMA_ALPHA**2))
+        #range weight
+        log_range = np.logaddexp(log_minimum, -math.log(self.SIGMA_RANGE * self.CONSTANT) - ((particleRange - auv_range)**2) / (2 * self.SIGMA_RANGE**2))
+        return log_alpha + log_range
 
-    def normalize(self, weights_list):
-        newlist = []
-        final_list_of_weights = []
-        # adds the weights of the lists after being individally normalized by its max denominator and then adds the weights of all the auvs together, then normalizes it
-        final_newlist = []
-
-        for i in range(len(weights_list)):
-            denominator = max(weights_list[i])
-            newlist = []
-            for weight in weights_list[i]:
-                weight = (1/ denominator) * weight
-                newlist.append(weight)
-            final_newlist.append(newlist)
-        final_list_of_weights_2 = []
-        for index in range(len(final_newlist[0])):
-            new_weight = 0
-            for weight in final_newlist:
-                new_weight += weight[index]
-            final_list_of_weights_2.append(new_weight)
-        final_denominator = max(final_list_of_weights_2)
-        normalized_list = []
-        for weight in final_list_of_weights_2:
-            weight_final = (1/ final_denominator) * weight
-            normalized_list.append(weight_final)
-        return normalized_list
-        
     def particleMean(self, new_particles):
-        """caculates the mean of the particles x and y positions"""
-        sum_x = 0
-        sum_y = 0
-        x_mean = 0
-        y_mean = 0
-        count = 0
-        for particle in new_particles:
-            sum_x += particle.x_p
-            sum_y += particle.y_p
-            count += 1
-        x_mean = sum_x/count
-        y_mean = sum_y/ count
-        xy_mean = [x_mean, y_mean]
+        """caculates the weighted mean of the particles x and y positions"""
+        xy_mean = [float(np.average(new_particles.x_p, weights = new_particles.weight_p)), float(np.average(new_particles.y_p, weights = new_particles.weight_p))]
         return xy_mean
 
     def meanError(self, x_mean, y_mean):
@@ -176,149 +216,429 @@ class ParticleFilter:
         print(range_error)
         return (range_error)
 
+    def adaptive_particle_count(self, particles):
+        """
+        returns the number of particles that KLD-sampling asks for, given the (resampled) particles,
+            kept between self.min_particles and self.max_particles
+        """
+        if self.min_particles == self.max_particles:
+            return self.max_particles
+        num_of_bins = count_occupied_bins(particles.x_p, particles.y_p, self.KLD_BIN_SIZE)
+        num_of_particles = kld_sample_size(num_of_bins, self.KLD_EPSILON, self.KLD_Z_QUANTILE)
+        return int(np.clip(num_of_particles, self.min_particles, self.max_particles))
+
     def correct(self, normalize_list, old_coordinates):
-        list_of_new_particles = []
-        new_particles = []
-        copy = []
-        count = -1
-        #print(normalize_list)
-        for particle in old_coordinates:
-            if particle.weight_p < 0.2:
-                count += 1
-                #print(particle.weight_p)
-                copy = deepcopy(particle)
-                list_of_new_particles.append(copy)
-                    
-                    #list_of_new_particles.append(copy)
-                    #print("count, ", count, "x, y", old_coordinates[count][:2] )
-                    #print(list_of_new_particles)
-            elif particle.weight_p < 0.4:
-                #print(particle.weight_p)
-                count += 1
-                copy1 = deepcopy(particle)
-                list_of_new_particles.append(copy1)
-                copy2 = deepcopy(particle)
-                list_of_new_particles.append(copy2)
-                    
-                    #print(list_of_new_particles)
-            elif particle.weight_p < 0.6:
-                #print(particle.weight_p)
-                count += 1
-                copy3 = deepcopy(particle)
-                list_of_new_particles.append(copy3)
-                copy4 = deepcopy(particle)
-                list_of_new_particles.append(copy4)                    
-                copy5 = deepcopy(particle)
-                list_of_new_particles.append(copy5)
-                    
-
-                    #print(list_of_new_particles)
-            elif particle.weight_p < .8:
-                #print(particle.weight_p)
-                count += 1
-                copy6 = deepcopy(particle)
-                list_of_new_particles.append(copy6)
-                copy7 = deepcopy(particle)
-                list_of_new_particles.append(copy7)
-                copy8 = deepcopy(particle)
-                list_of_new_particles.append(copy8)
-                copy9 = deepcopy(particle)
-                list_of_new_particles.append(copy9)
-                    
-                    
-                    #print(list_of_new_particles)
-            elif particle.weight_p <= 1.0:
-                #print(particle.weight_p)
-                count += 1
-                copy10 = deepcopy(particle)
-                list_of_new_particles.append(copy10)
-                copy11 = deepcopy(particle)
-                list_of_new_particles.append(copy11)
-                copy12 = deepcopy(particle)
-                list_of_new_particles.append(copy12)
-                copy13 = deepcopy(particle)
-                list_of_new_particles.append(copy13)
-                copy14 = deepcopy(particle)
-                list_of_new_particles.append(copy14)
-            else:
-                print("something is not right with the weights")
-        #print('list of new particles')
-        #print(list_of_new_particles)
-        
-        #for particle in list_of_new_particles: 
-           # print("x:", particle.x_p, " y:", particle.y_p, " velocity:", particle.v_p, " theta:", particle.theta_p, " weight:", particle.weight_p)
-        #print(count)
-        for n in range(len(normalize_list)): 
-            x = random.choice(len(list_of_new_particles))
-            new_particles.append(list_of_new_particles[x])
-        #print("new particles")
-        #print(new_particles)
+        """
+        resamples the particles with self.resample_method, the weights of the new particles are reset to 1/N
+            when the filter is adaptive, the number of new particles is picked with KLD-sampling
+
+        Parameter:
+            normalize_list - numpy array of particle weights
+            old_coordinates - a ParticleSet
+        """
+        indices = resample(normalize_list, self.resample_method, rng = self.rng)
+        new_particles = old_coordinates.select(indices)
+        num_of_particles = self.adaptive_particle_count(new_particles)
+        if num_of_particles != len(new_particles):
+            indices = resample(normalize_list, self.resample_method, num_of_particles, rng = self.rng)
+            new_particles = old_coordinates.select(indices)
+        self.num_of_particles = len(new_particles)
+        new_particles.weight_p = np.full(len(new_particles), 1/len(new_particles))
         return new_particles
     
     def particle_coordinates(self, particles): 
-        particle_coordinates = []
-        individual_coordinates = []
-        for particle in particles:
-            individual_coordinates.append(particle.x_p)
-            individual_coordinates.append(particle.y_p)
-            individual_coordinates.append(particle.weight_p)
-            #print("individual coordinates", individual_coordinates)
-            particle_coordinates.append(individual_coordinates)
-            individual_coordinates = []
-            #print("particle_coordinates", particle_coordinates)
-        return particle_coordinates
+        """returns a 2D array, each row is [x, y, weight] of one particle"""
+        return np.column_stack((particles.x_p, particles.y_p, particles.weight_p))
     
     def cluster_over_time_function(self, particles, actual_shark_coordinate_x, actual_shark_coordinate_y, sim_time, list_of_error_mean):
+        """
+        returns [sim_time] if at least 56% of the particles are within 1.1 * list_of_error_mean[9] of the shark
+        """
         list_of_answers = []
-        count = 0
-        for particle in particles:
-            sum = math.sqrt(((particle.x_p - actual_shark_coordinate_x[-1])**2)  + ((particle.y_p - actual_shark_coordinate_y[-1])**2))
-            if sum <= 1.1* (list_of_error_mean[9]):
-                count += 1
-            if count == 560:
-                initial_time = sim_time
-                list_of_answers.append(sim_time)
-            return list_of_answers
-
-    def create_and_update(self, particles):
-        particles_list = []
-        for particle in particles: 
-            particle.update_particle(.1)
-            particles_list.append(particle)
-        return particles_list
-        #print("x:", particle.x_p, " y:", particle.y_p, " velocity:", particle.v_p, " theta:", particle.theta_p, " weight:", particle.weight_p)
-
-    def update_weights(self,particles, list_of_range_bearing):
-        final_list_of_weights = []
-        # list_of_range_bearing = [shark_data.x, shark_data.y, shark_data.theta, Z_shark_range, Z_shark_bearing,  shark_id)]
-
-        for i in range(len(list_of_range_bearing)):
-            print("measurement number in particleFilter ", list_of_range_bearing[i][5], " theta: ", list_of_range_bearing[i][2] )
-
-            for particle in particles:
-                particleAlpha = particle.calc_particle_alpha(list_of_range_bearing[i][0], list_of_range_bearing[i][1], list_of_range_bearing[i][2])
-                particleRange = particle.calc_particle_range(list_of_range_bearing[i][0], list_of_range_bearing[i][1])
-                particle.weight(list_of_range_bearing[i][3], particleAlpha, list_of_range_bearing[i][4], particleRange)
-            list_of_weights = []
-            for particle in particles: 
-                list_of_weights.append(particle.weight_p)
-            final_list_of_weights.append(list_of_weights)
-
-        normalized_weights = self.normalize(final_list_of_weights)
-        count = 0
-        for particle in particles: 
-            particle.weight_p = normalized_weights[count]
-            #print("new normalized particle weight: ", particle.weight_p, "aka i work")
-            count += 1
-        new_particles = self.correct(normalized_weights, particles)
-        particles = new_particles
-        #for particle in particles: 
-            #print("x:", particle.x_p, " y:", particle.y_p, " velocity:", particle.v_p, " theta:", particle.theta_p, " weight:", particle.weight_p)
+        dist = np.hypot(particles.x_p - actual_shark_coordinate_x[-1], particles.y_p - actual_shark_coordinate_y[-1])
+        count = np.count_nonzero(dist <= 1.1 * (list_of_error_mean[9]))
+        if count >= 0.56 * len(particles):
+            list_of_answers.append(sim_time)
+        return list_of_answers
+
+    def create_and_update(self, particles, dt = .1):
+        """
+            updates the particles location with random v and theta
+
+            input (dt) is the amount of time the particles are "moving" 
+                generally set to .1, but it should be whatever the "time.sleep" is set to in the main loop
+        """
+        n = particles.x_p.shape
+        #change velocity & pass through velocity_wrap
+        particles.v_p = velocity_wrap_array(particles.v_p + self.rng.uniform(0, self.RANDOM_VELOCITY, size = n))
+        #change theta & pass through angle_wrap
+        particles.theta_p = angle_wrap_array(particles.theta_p + self.rng.uniform(-self.RANDOM_THETA, self.RANDOM_THETA, size = n))
+        #change x & y coordinates to match 
+        particles.x_p = particles.x_p + particles.v_p * np.cos(particles.theta_p) * dt
+        particles.y_p = particles.y_p + particles.v_p * np.sin(particles.theta_p) * dt
+        return particles
+
+    def propagate(self, particles, elapsed, dt = .1):
+        """
+            moves the particles for elapsed seconds in steps of dt, with one create_and_update per step
+                every step adds its own random change of v and theta, the same as calling create_and_update once per tick of the main loop
+                the last step is shorter when elapsed is not a multiple of dt
+        """
+        num_of_steps = int(math.floor(elapsed / dt + 1e-9))
+        for _ in range(num_of_steps):
+            particles = self.create_and_update(particles, dt)
+        remainder = elapsed - num_of_steps * dt
+        if remainder > 1e-9:
+            particles = self.create_and_update(particles, remainder)
+        return particles
+
+    def update_weights(self, particles, list_of_range_bearing):
+        """
+        multiplies the likelihood of the measurements of every auv into the particle weights,
+            the particles are resampled when the effective sample size gets too small
+
+        Parameter:
+            particles - a ParticleSet
+            list_of_range_bearing - one measurement per auv, every measurement needs all 8 elements
+                [shark_data.x, shark_data.y, auv theta, Z_shark_range, Z_shark_bearing, shark_id, auv x, auv y]
+                the particles are returned unchanged when the list is empty
+        """
+        if len(list_of_range_bearing) == 0:
+            return particles
+        measurements = np.array([measurement[:5] + measurement[6:8] for measurement in list_of_range_bearing], dtype = float)
+        # every column is shaped (number of auvs, 1), so the particle arrays broadcast into one row per auv
+        theta_auv = measurements[:, 2:3]
+        auv_range = measurements[:, 3:4]
+        auv_alpha = measurements[:, 4:5]
+        x_auv = measurements[:, 5:6]
+        y_auv = measurements[:, 6:7]
+
+        particleAlpha = self.calc_particle_alpha(particles, x_auv, y_auv, theta_auv)
+        particleRange = self.calc_particle_range(particles, x_auv, y_auv)
+        # the auvs measure the shark independently, so their evidence is fused
+        #   by adding the log weights of every auv together in one pass
+        log_likelihood = self.log_weight(auv_alpha, particleAlpha, auv_range, particleRange).sum(axis = 0)
+
+        # the new evidence is multiplied into the weights the particles already had,
+        #   since they are only resampled when the effective sample size gets too small
+        with np.errstate(divide = "ignore"):
+            log_weights = np.log(particles.weight_p) + log_likelihood
+        particles.weight_p = normalize_log_weights(log_weights)
+        if effective_sample_size(particles.weight_p) < self.resample_threshold * len(particles):
+            particles = self.correct(particles.weight_p, particles)
+        return particles
+
+    def create(self):
+        n = self.num_of_particles
+        #particle has 5 properties: x, y, velocity, theta, weight (starts at 1/N)
+        particles = ParticleSet(self.x_shark + self.rng.uniform(-self.INITIAL_PARTICLE_RANGE, self.INITIAL_PARTICLE_RANGE, size = n),\
+            self.y_shark + self.rng.uniform(-self.INITIAL_PARTICLE_RANGE, self.INITIAL_PARTICLE_RANGE, size = n),\
+            self.rng.uniform(0, 5, size = n),\
+            self.rng.uniform(-math.pi, math.pi, size = n),\
+            np.full(n, 1/n))
         return particles
+
+
+class MultiSharkParticleFilter(ParticleFilter):
+    """
+    Particle filter that tracks several sharks at once
+        the particles of all the sharks live in the same ParticleSet, 
+        where every array is shaped (number of sharks, number of particles),
+        so one update handles the measurements from every auv for every shark
+    """
+    def __init__(self, shark_state_dict, init_auv_list, num_of_particles = 1000, resample_method = "systematic", resample_threshold = 0.5,\
+        min_particles = None, max_particles = None, rng = None):
+        """
+        Parameter:
+            shark_state_dict - a dictionary, key = id of the shark & value = the shark's initial position (Motion_plan_state)
+            init_auv_list - a list of auvs
+            the other parameters are the same as ParticleFilter, every shark has the same number of particles
+        """
+        self.shark_ids = sorted(shark_state_dict)
+        # row of the particle arrays that belongs to each shark
+        self.shark_index = {shark_id: index for index, shark_id in enumerate(self.shark_ids)}
+        x_shark = np.array([shark_state_dict[shark_id].x for shark_id in self.shark_ids], dtype = float)
+        y_shark = np.array([shark_state_dict[shark_id].y for shark_id in self.shark_ids], dtype = float)
+        super().__init__(x_shark, y_shark, init_auv_list, num_of_particles, resample_method, resample_threshold, min_particles, max_particles, rng)
+
     def create(self):
-        NUMBER_OF_PARTICLES = 1000
-        particles = []
-        for x in range(0, NUMBER_OF_PARTICLES):
-                new_particle = Particle(self.x_shark, self.y_shark)
-                particles.append(new_particle)
+        k = len(self.shark_ids)
+        n = self.num_of_particles
+        particles = ParticleSet(self.x_shark[:, np.newaxis] + self.rng.uniform(-self.INITIAL_PARTICLE_RANGE, self.INITIAL_PARTICLE_RANGE, size = (k, n)),\
+            self.y_shark[:, np.newaxis] + self.rng.uniform(-self.INITIAL_PARTICLE_RANGE, self.INITIAL_PARTICLE_RANGE, size = (k, n)),\
+            self.rng.uniform(0, 5, size = (k, n)),\
+            self.rng.uniform(-math.pi, math.pi, size = (k, n)),\
+            np.full((k, n), 1/n))
         return particles
+
+    def update_weights(self, particles, list_of_range_bearing):
+        """
+        Parameter:
+            particles - a ParticleSet with one row per shark
+            list_of_range_bearing - one list of measurements per auv, with one measurement per shark
+                [shark_data.x, shark_data.y, auv theta, Z_shark_range, Z_shark_bearing, shark_id, auv x, auv y]
+        """
+        all_measurements = [measurement for auv_measurements in list_of_range_bearing for measurement in auv_measurements]
+        if all_measurements == []:
+            return particles
+        shark_rows = np.array([self.shark_index[measurement[5]] for measurement in all_measurements])
+        measurements = np.array([measurement[:5] + measurement[6:8] for measurement in all_measurements], dtype = float)
+        # keep track of the actual shark positions to calculate the errors
+        self.x_shark[shark_rows] = measurements[:, 0]
+        self.y_shark[shark_rows] = measurements[:, 1]
+
+        # one row of weights per measurement, computed on the particles of the shark it measured
+        measured_particles = ParticleSet(particles.x_p[shark_rows], particles.y_p[shark_rows], None, None, None)
+        particleAlpha = self.calc_particle_alpha(measured_particles, measurements[:, 5:6], measurements[:, 6:7], measurements[:, 2:3])
+        particleRange = self.calc_particle_range(measured_particles, measurements[:, 5:6], measurements[:, 6:7])
+        list_of_log_weights = self.log_weight(measurements[:, 4:5], particleAlpha, measurements[:, 3:4], particleRange)
+
+        # the log weights of every auv are added to the row of the shark they measured,
+        #   sharks without a new measurement keep their weights
+        log_likelihood = np.zeros(particles.x_p.shape)
+        np.add.at(log_likelihood, shark_rows, list_of_log_weights)
+
+        with np.errstate(divide = "ignore"):
+            log_weights = np.log(particles.weight_p) + log_likelihood
+        particles.weight_p = normalize_log_weights(log_weights, axis = 1)
+        # effective sample size of every shark, the weights of each row already sum to 1
+        ess = 1.0 / np.sum(particles.weight_p**2, axis = 1)
+        rows = np.flatnonzero(ess < self.resample_threshold * len(particles))
+        if len(rows) > 0:
+            particles = self.correct(particles.weight_p[rows], particles, rows)
+        return particles
+
+    def adaptive_particle_count(self, particles):
+        """
+        returns the number of particles per shark, the largest KLD-sampling count of all the sharks
+            so every shark can keep the same number of particles
+        """
+        if self.min_particles == self.max_particles:
+            return self.max_particles
+        num_of_particles = max(kld_sample_size(count_occupied_bins(x_p, y_p, self.KLD_BIN_SIZE), self.KLD_EPSILON, self.KLD_Z_QUANTILE)\
+            for x_p, y_p in zip(particles.x_p, particles.y_p))
+        return int(np.clip(num_of_particles, self.min_particles, self.max_particles))
+
+    def correct(self, normalize_list, old_coordinates, rows = None):
+        """
+        resamples the particles of the given rows (all of the sharks by default) in place,
+            the weights of the new particles are reset to 1/N
+
+        when the filter is adaptive and KLD-sampling asks for a different number of particles,
+            every shark is resampled to the new number of particles instead
+
+        Parameter:
+            normalize_list - 2D numpy array of particle weights, one row per resampled shark
+            old_coordinates - a ParticleSet with one row per shark
+            rows - (optional) numpy array of the rows to resample
+        """
+        if rows is None:
+            rows = np.arange(len(self.shark_ids))
+        indices = resample(normalize_list, self.resample_method, rng = self.rng)
+        if self.min_particles != self.max_particles:
+            # the count is picked from the resampled sharks and the sharks that were not resampled
+            resampled = ParticleSet(old_coordinates.x_p.copy(), old_coordinates.y_p.copy(), None, None, None)
+            resampled.x_p[rows] = np.take_along_axis(resampled.x_p[rows], indices, axis = 1)
+            resampled.y_p[rows] = np.take_along_axis(resampled.y_p[rows], indices, axis = 1)
+            num_of_particles = self.adaptive_particle_count(resampled)
+            if num_of_particles != len(old_coordinates):
+                indices = resample(old_coordinates.weight_p, self.resample_method, num_of_particles, rng = self.rng)
+                new_particles = old_coordinates.select((np.arange(len(self.shark_ids))[:, np.newaxis], indices))
+                new_particles.weight_p = np.full(indices.shape, 1/num_of_particles)
+                self.num_of_particles = num_of_particles
+                return new_particles
+        old_coordinates.select_rows(rows, indices)
+        old_coordinates.weight_p[rows] = 1/len(old_coordinates)
+        return old_coordinates
+
+    def particleMean(self, new_particles):
+        """caculates the weighted mean of the particles x and y positions, returns [x means, y means] with one entry per shark"""
+        xy_mean = [np.sum(new_particles.x_p * new_particles.weight_p, axis = 1), np.sum(new_particles.y_p * new_particles.weight_p, axis = 1)]
+        return xy_mean
+
+    def particleCovariance(self, new_particles):
+        """caculates the weighted covariance of the particles x and y positions, returns an array shaped (number of sharks, 2, 2)"""
+        x_mean, y_mean = self.particleMean(new_particles)
+        dx = new_particles.x_p - x_mean[:, np.newaxis]
+        dy = new_particles.y_p - y_mean[:, np.newaxis]
+        w = new_particles.weight_p
+        cov_xy = np.sum(w * dx * dy, axis = 1)
+        return np.stack((np.stack((np.sum(w * dx * dx, axis = 1), cov_xy), axis = -1),\
+            np.stack((cov_xy, np.sum(w * dy * dy, axis = 1)), axis = -1)), axis = 1)
+
+    def estimate(self, new_particles):
+        """
+        returns a dictionary, key = id of the shark & value = (mean [x, y], 2x2 covariance matrix)
+        """
+        x_mean, y_mean = self.particleMean(new_particles)
+        covariances = self.particleCovariance(new_particles)
+        return {shark_id: (np.array([x_mean[index], y_mean[index]]), covariances[index]) for shark_id, index in self.shark_index.items()}
+
+    def meanError(self, x_mean, y_mean):
+        """returns the distance between the estimated and the actual position of every shark"""
+        range_error = np.hypot(x_mean - self.x_shark, y_mean - self.y_shark)
+        print("error")
+        print(range_error)
+        return range_error
+
+
+class MeasurementRingBuffer:
+    """
+    Fixed size queue of measurements between one producer (the navigation loop) and one consumer (the filter thread)
+
+    The producer only moves self.head and the consumer only moves self.tail, so neither of them needs a lock,
+        when the buffer is full the new measurements are dropped and counted in self.num_of_dropped
+    """
+    def __init__(self, capacity = 256):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        # number of items ever pushed & popped
+        self.head = 0
+        self.tail = 0
+        self.num_of_dropped = 0
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def push(self, item):
+        """adds an item, returns False if the buffer is full and the item was dropped"""
+        if self.head - self.tail >= self.capacity:
+            self.num_of_dropped += 1
+            return False
+        self.slots[self.head % self.capacity] = item
+        # the item has to be stored before head moves, so the consumer never reads an empty slot
+        self.head += 1
+        return True
+
+    def pop_all(self):
+        """removes and returns every item in the buffer, oldest first"""
+        head = self.head
+        items = []
+        for index in range(self.tail, head):
+            items.append(self.slots[index % self.capacity])
+            self.slots[index % self.capacity] = None
+        self.tail = head
+        return items
+
+
+class PosteriorSnapshot:
+    """
+    Copy of the particle filter's estimate after an update, it is never changed after it is published
+
+        curr_time - time of the last measurement used, None before the first update
+        x_mean, y_mean - weighted mean of the particles (arrays with one entry per shark for MultiSharkParticleFilter)
+        x_shark, y_shark - copies of the actual shark positions the filter knew of at the same time
+        particles - ParticleSet with copies of the particles x, y and weight
+        num_of_updates - number of measurements the filter has used
+    """
+    def __init__(self, curr_time, x_mean, y_mean, x_shark, y_shark, particles, num_of_updates):
+        self.curr_time = curr_time
+        self.x_mean = x_mean
+        self.y_mean = y_mean
+        self.x_shark = x_shark
+        self.y_shark = y_shark
+        self.particles = particles
+        self.num_of_updates = num_of_updates
+
+    def meanError(self):
+        """returns the distance between the estimated and the actual position of the shark (of every shark for MultiSharkParticleFilter)"""
+        return np.hypot(np.asarray(self.x_mean) - self.x_shark, np.asarray(self.y_mean) - self.y_shark)
+
+
+class ParticleFilterWorker:
+    """
+    Runs the updates of a particle filter in a background thread
+
+    The navigation loop adds measurements with add_measurements, which never waits for the filter,
+        and reads the newest estimate with latest_snapshot, so a slow update cannot stall the control loop
+    """
+    def __init__(self, particle_filter, capacity = 256, idle_timeout = 0.1, dt = .1, start_time = None):
+        """
+        Parameter:
+            particle_filter - a ParticleFilter or MultiSharkParticleFilter
+            capacity - (optional) number of measurement sets that can wait for the filter
+            idle_timeout - (optional) how long (sec) the thread sleeps when there are no measurements
+            dt - (optional) length (sec) of one motion step of the particles, the tick of the main loop,
+                the particles are moved in steps of dt up to the time of every measurement set
+            start_time - (optional) time the particles start moving, without it they move for one dt before the first update
+        """
+        self.particle_filter = particle_filter
+        self.particles = particle_filter.create()
+        self.measurement_buffer = MeasurementRingBuffer(capacity)
+        self.idle_timeout = idle_timeout
+        self.dt = dt
+        self.last_time = None
+        # time up to which the particles have been moved
+        self.propagated_time = start_time
+        self.num_of_updates = 0
+        # the exception that stopped the thread, latest_snapshot raises it
+        self.error = None
+        self.new_measurements = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.publish()
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, timeout = None):
+        """stops the thread after it finishes the measurements that are already in the buffer"""
+        self.stop_event.set()
+        self.new_measurements.set()
+        self.thread.join(timeout)
+
+    def add_measurements(self, curr_time, list_of_range_bearing):
+        """
+        queues a set of measurements for the filter, returns False if the buffer is full and they were dropped
+
+        Parameter:
+            curr_time - time of the measurements
+            list_of_range_bearing - the measurements, in the format that the filter's update_weights takes
+        """
+        added = self.measurement_buffer.push((curr_time, list_of_range_bearing))
+        self.new_measurements.set()
+        return added
+
+    def latest_snapshot(self):
+        """
+        returns the newest PosteriorSnapshot
+
+        raises RuntimeError if an update failed and stopped the thread, instead of returning a posterior that will never change again
+        """
+        if self.error is not None:
+            raise RuntimeError("the particle filter thread stopped: " + repr(self.error)) from self.error
+        return self.snapshot
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                self.new_measurements.wait(self.idle_timeout)
+                # clear before reading the buffer, so measurements added during the update wake the thread up again
+                self.new_measurements.clear()
+                self.process_measurements()
+            self.process_measurements()
+        except Exception as error:
+            self.error = error
+
+    def process_measurements(self):
+        """applies every queued measurement in order, then publishes a new snapshot"""
+        measurements = self.measurement_buffer.pop_all()
+        if measurements == []:
+            return
+        for curr_time, list_of_range_bearing in measurements:
+            elapsed = self.dt if self.propagated_time is None else curr_time - self.propagated_time
+            if elapsed > 0:
+                self.particles = self.particle_filter.propagate(self.particles, elapsed, self.dt)
+                self.propagated_time = curr_time
+            self.particles = self.particle_filter.update_weights(self.particles, list_of_range_bearing)
+            self.last_time = curr_time
+            self.num_of_updates += 1
+        self.publish()
+
+    def publish(self):
+        particles = self.particles
+        x_mean, y_mean = self.particle_filter.particleMean(particles)
+        # replacing the reference is atomic, so the reader always gets a complete snapshot
+        self.snapshot = PosteriorSnapshot(self.last_time, x_mean, y_mean,\
+            np.array(self.particle_filter.x_shark, dtype = float), np.array(self.particle_filter.y_shark, dtype = float),\
+            ParticleSet(particles.x_p.copy(), particles.y_p.copy(), None, None, particles.weight_p.copy()), self.num_of_updates)
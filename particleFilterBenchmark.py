@@ -0,0 +1,162 @@
+"""
+Micro-benchmarks of the particle filter stages
+
+Every stage (create_and_update, update_weights, correct, log_weight, normalize_log_weights, particleMean) is timed for every number of particles,
+    and the stages that use measurements are also timed for every number of auvs.
+For every run the results have:
+    seconds - best time out of the repeats
+    particles_per_second - number of particles / seconds
+    peak_bytes - largest amount of memory the stage had allocated at once (tracemalloc)
+    allocated_blocks - number of memory blocks the stage allocated and did not free (tracemalloc)
+
+The results are written as JSON, so the numbers of two commits can be compared with --compare.
+"""
+import argparse
+import json
+import math
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+from particleFilter import ParticleFilter, normalize_log_weights
+
+DEFAULT_PARTICLE_COUNTS = [1000, 10000, 100000, 1000000]
+DEFAULT_AUV_COUNTS = [1, 2, 4, 8]
+# the stages whose cost depends on the number of auvs
+AUV_STAGES = ["update_weights", "log_weight"]
+STAGES = ["create_and_update", "update_weights", "correct", "log_weight", "normalize_log_weights", "particleMean"]
+
+def make_measurements(num_of_auvs, x_shark, y_shark, rng):
+    """
+    returns a list of measurements, one per auv, in the format that ParticleFilter.update_weights takes
+        the auvs are spread on a circle around the shark
+    """
+    list_of_range_bearing = []
+    for auv_angle in np.linspace(0, 2 * math.pi, num_of_auvs, endpoint = False):
+        x_auv = x_shark + 100 * math.cos(auv_angle)
+        y_auv = y_shark + 100 * math.sin(auv_angle)
+        theta_auv = rng.uniform(-math.pi, math.pi)
+        bearing = math.remainder(math.atan2(y_shark - y_auv, x_shark - x_auv) - theta_auv, 2 * math.pi)
+        list_of_range_bearing.append([x_shark, y_shark, theta_auv, 100.0, bearing, 1, x_auv, y_auv])
+    return list_of_range_bearing
+
+def make_stage(stage, num_of_particles, num_of_auvs, seed = 0):
+    """
+    returns a function without arguments that runs the stage once
+    """
+    rng = np.random.default_rng(seed)
+    # resample_threshold = 0 keeps update_weights from resampling, so correct is only timed on its own
+    test_particle = ParticleFilter(0.0, 0.0, [], num_of_particles = num_of_particles, resample_threshold = 0, rng = rng)
+    particles = test_particle.create()
+    if stage == "create_and_update":
+        return lambda: test_particle.create_and_update(particles)
+    if stage == "update_weights":
+        list_of_range_bearing = make_measurements(num_of_auvs, 0.0, 0.0, rng)
+        return lambda: test_particle.update_weights(particles, list_of_range_bearing)
+    if stage == "correct":
+        weights = rng.random(num_of_particles)
+        return lambda: test_particle.correct(weights, particles)
+    if stage == "log_weight":
+        # one row per auv, the same shapes that update_weights passes in
+        x_auv, y_auv = rng.uniform(-100, 100, size = (2, num_of_auvs, 1))
+        theta_auv, auv_alpha = rng.uniform(-math.pi, math.pi, size = (2, num_of_auvs, 1))
+        auv_range = rng.uniform(0, 200, size = (num_of_auvs, 1))
+        particleAlpha = test_particle.calc_particle_alpha(particles, x_auv, y_auv, theta_auv)
+        particleRange = test_particle.calc_particle_range(particles, x_auv, y_auv)
+        return lambda: test_particle.log_weight(auv_alpha, particleAlpha, auv_range, particleRange)
+    if stage == "normalize_log_weights":
+        log_weights = rng.normal(0, 10, size = num_of_particles)
+        return lambda: normalize_log_weights(log_weights)
+    if stage == "particleMean":
+        return lambda: test_particle.particleMean(particles)
+    raise ValueError("unknown stage: " + stage)
+
+def time_stage(function, num_of_repeats):
+    """returns the best time (seconds) out of num_of_repeats calls of the function"""
+    function()
+    best_time = math.inf
+    for _ in range(num_of_repeats):
+        start = time.perf_counter()
+        function()
+        best_time = min(best_time, time.perf_counter() - start)
+    return best_time
+
+def measure_memory(function):
+    """returns (peak bytes, number of blocks that were allocated and not freed) of one call of the function"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        result = function()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        del result
+    finally:
+        tracemalloc.stop()
+    allocated_blocks = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, "lineno"))
+    return peak - baseline, allocated_blocks
+
+def run_benchmarks(particle_counts = DEFAULT_PARTICLE_COUNTS, auv_counts = DEFAULT_AUV_COUNTS, stages = STAGES, num_of_repeats = 5):
+    """
+    returns a list with one dictionary of results per (stage, number of particles, number of auvs)
+        the number of auvs is None for the stages that do not use measurements
+    """
+    results = []
+    for stage in stages:
+        for num_of_particles in particle_counts:
+            for num_of_auvs in (auv_counts if stage in AUV_STAGES else [None]):
+                seconds = time_stage(make_stage(stage, num_of_particles, num_of_auvs or 1), num_of_repeats)
+                peak_bytes, allocated_blocks = measure_memory(make_stage(stage, num_of_particles, num_of_auvs or 1))
+                results.append({"stage": stage, "num_of_particles": num_of_particles, "num_of_auvs": num_of_auvs,\
+                    "seconds": seconds, "particles_per_second": num_of_particles / seconds,\
+                    "peak_bytes": peak_bytes, "allocated_blocks": allocated_blocks})
+                print(format_result(results[-1]))
+    return results
+
+def format_result(result):
+    auvs = "" if result["num_of_auvs"] is None else str(result["num_of_auvs"]) + " auvs"
+    return "{:<22} {:>8} particles {:>7}  {:>10.3f} ms  {:>12.3e} particles/s  {:>8.2f} MB peak  {:>6} blocks".format(\
+        result["stage"], result["num_of_particles"], auvs, result["seconds"] * 1000, result["particles_per_second"],\
+        result["peak_bytes"] / 2**20, result["allocated_blocks"])
+
+def git_commit():
+    """returns the current git commit, or None outside of a git repository"""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old_results, new_results):
+    """prints how much faster (> 1) or slower (< 1) every run of new_results is compared to the same run of old_results"""
+    old_seconds = {(result["stage"], result["num_of_particles"], result["num_of_auvs"]): result["seconds"] for result in old_results}
+    for result in new_results:
+        key = (result["stage"], result["num_of_particles"], result["num_of_auvs"])
+        if key in old_seconds:
+            print("{:<22} {:>8} particles {:>7}  speedup {:.2f}x".format(result["stage"], result["num_of_particles"],\
+                "" if result["num_of_auvs"] is None else str(result["num_of_auvs"]) + " auvs", old_seconds[key] / result["seconds"]))
+
+def main():
+    parser = argparse.ArgumentParser(description = "time the particle filter stages")
+    parser.add_argument("--particles", type = int, nargs = "+", default = DEFAULT_PARTICLE_COUNTS)
+    parser.add_argument("--auvs", type = int, nargs = "+", default = DEFAULT_AUV_COUNTS)
+    parser.add_argument("--stages", nargs = "+", choices = STAGES, default = STAGES)
+    parser.add_argument("--repeats", type = int, default = 5)
+    parser.add_argument("--output", default = "particle_filter_benchmark.json")
+    parser.add_argument("--compare", default = None, help = "JSON file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.particles, args.auvs, args.stages, args.repeats)
+    with open(args.output, "w") as output_file:
+        json.dump({"commit": git_commit(), "python": platform.python_version(), "numpy": np.__version__,\
+            "machine": platform.machine(), "results": results}, output_file, indent = 2)
+
+    if args.compare is not None:
+        with open(args.compare) as compare_file:
+            compare(json.load(compare_file)["results"], results)
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,7 @@ from motion_plan_state import Motion_plan_state
 from shapely.wkt import loads as load_wkt 
 from shapely.geometry import Polygon 
 from catalina import create_cartesian
-from sharkOccupancyGrid import SharkOccupancyGrid, splitCell
+from sharkOccupancyGrid import SharkOccupancyGrid, splitCell, timeBinned, getGridByTime
 from matplotlib import cm, patches, collections
 from cost import Cost
 
@@ -42,8 +42,13 @@ def createSharkGrid(filepath, cell_list):
 
             temp = row["grid"][1:len(row["grid"])-1]
             temp = temp.split(", ")
+            if len(temp) != len(cell_list):
+                # grids exported before splitCell returned a CellRaster have one value per clipped polygon cell,
+                #   they do not line up with the cells of the raster
+                raise ValueError("{} has {} values per grid but cell_list has {} cells, export the grids again with the current cell list"\
+                    .format(filepath, len(temp), len(cell_list)))
             val = {}
-            for i in range(len(temp)-1): # initially was len(temp); changed to fix outofindex error
+            for i in range(len(temp)):
                 val[cell_list[i].bounds] = float(temp[i])
             test[(key[0],key[1])] = val
     return test
@@ -127,9 +132,9 @@ class astar:
         self.cell_list = splitCell(self.boundary_poly, 10) # divide the workspace into cells 
 
         if sharkGrid == {}:
-            self.sharkGrid = createSharkGrid('path_planning/shark_data/AUVGrid_prob_500_straight.csv', self.cell_list)
-        else:
-            self.sharkGrid = sharkGrid
+            # the AUV detecting grids of shark_dict, read from the grid cache after the first time they are constructed
+            sharkGrid = SharkOccupancyGrid(10, self.boundary_poly, 50, 50, self.cell_list).convert(shark_dict)[1]
+        self.sharkGrid = timeBinned(sharkGrid)
 
         self.sharkDict = shark_dict
         
@@ -444,27 +449,23 @@ class astar:
         Return the SOG that corresponds to the curr_time_stamp
 
         Parameter: 
-            grid: a dictionary of shark occupancy grid maps
+            grid: a TimeBinnedGrids of shark occupancy grid maps, like self.sharkGrid
                 key: timebin, tuple(start time, end time)
                 value: a dictionary representing occupancy grid of each shark during this time bin
             curr_time_stamp: an integer
         """
         
-        for time, AUVGrid in self.sharkGrid.items(): # time: tuple(start time, end time); value: a dictionary representing occupancy grid of each shark during this time bin
-            
-            print ("\n", "time: ", time, "current time stamp: ", curr_time_stamp)
-
-            if self.with_in_time_bin(time, curr_time_stamp):
-                
-                return AUVGrid
+        # the time bin is found with the time index of grid, without walking through every bin
+        return getGridByTime(curr_time_stamp, grid)
 
     def findCurrAUVGrid(self, grid_dict, child_node):
+        """
+        Return the AUV detecting grid of grid_dict (a TimeBinnedGrids, like self.sharkGrid) at the time stamp of child_node
+        """
 
         curr_time_stamp = child_node.time_stamp
 
-        for key_time, AUVGrid in grid_dict.items():
-            if self.with_in_time_bin(key_time, curr_time_stamp):
-                return AUVGrid
+        return getGridByTime(curr_time_stamp, grid_dict)
 
     def get_max_prob_from_grid(self, curr_grid):
         """
@@ -493,6 +494,12 @@ class astar:
         x_test = node.position[0]
         y_test = node.position[1]
 
+        if hasattr(currGrid, "value_at"):
+            # a DenseGridBin finds the cell by index arithmetic
+            prob = float(currGrid.value_at(x_test, y_test))
+            print ("\n", "cell probability: ", prob)
+            return prob
+
         key = None
        
         for pos_tuple in list(currGrid.keys()):
@@ -522,6 +529,12 @@ class astar:
             currGrid: a dictionary representing occupancy grid of each shark during this time bin
         """
 
+        if hasattr(currGrid, "pyramid"):
+            # a DenseGridBin keeps the sorted sums of its cells
+            total = currGrid.pyramid.topSum(n)
+            print ("\n", "top n probabilities: ", total)
+            return total
+
         total = 0
         probabilities = list(currGrid.values())
         probabilities.sort(reverse=True)
@@ -695,9 +708,9 @@ def main():
         boundary_poly.append((pos.x, pos.y))
 
     boundary = Polygon(boundary_poly) # a Polygon object that represents the boundary of our workspace 
-    sharkOccupancyGrid = SharkOccupancyGrid(shark_dict, 10, boundary, 50, 50)
+    sharkOccupancyGrid = SharkOccupancyGrid(10, boundary, 50, 50)
 
-    grid_dict = sharkOccupancyGrid.convert()
+    grid_dict = sharkOccupancyGrid.convert(shark_dict)
     plot(sharkOccupancyGrid, grid_dict[0], final_path_mps["path"])
 
 if __name__ == "__main__":
@@ -6,6 +6,7 @@ import numpy as np
 
 #from rrt_dubins import RRT
 from motion_plan_state import Motion_plan_state
+from sharkOccupancyGrid import timeBinned
 
 def test_cost_func(path, length, bonus_area, weights=[1,0]):
     '''
@@ -142,6 +143,25 @@ def habitat_time_cost_func(path, length, habitats, dist, weights=[1,-1,-1]):
 
     return [sum(cost), cost]
 
+def habitat_array(habitats):
+    '''
+    the habitats as a numpy array (number of habitats, 3) of x, y and size, an array is returned as it is
+
+    habitats: a list of habitat areas represented as motion_plan_states
+    '''
+    if isinstance(habitats, np.ndarray):
+        return habitats
+    return np.array([[habitat.x, habitat.y, habitat.size] for habitat in habitats], dtype = float).reshape(-1, 3)
+
+def path_arrays(path):
+    '''
+    the x, y and time stamp of a list of motion_plan_states as three numpy arrays
+    '''
+    xs = np.array([mps.x for mps in path], dtype = float)
+    ys = np.array([mps.y for mps in path], dtype = float)
+    ts = np.array([mps.traj_time_stamp for mps in path], dtype = float)
+    return xs, ys, ts
+
 def habitat_shark_cost_func(path, total_traj_time, habitats, shark_dict, weight):
     '''
     cost function for habitat exploration and shark tracking
@@ -157,54 +177,92 @@ def habitat_shark_cost_func(path, total_traj_time, habitats, shark_dict, weight)
     output: 
     cost: [total cost, [cost for w1, cost for w2, ...]]
     '''
-    #set the weight for each term in cost function
-    w1 = weight[0]
-    w2 = weight[1]
-    w3 = weight[2]
+    xs, ys, ts = path_arrays(path)
+    return habitat_shark_cost_arrays(xs, ys, ts, total_traj_time, habitats, shark_dict, weight)
 
-    cost = [0 for _ in range(len(weight))]
-    
-    visited = {} #dictionary of visited habitats
-    for i in range(len(habitats)):
-        visited[i+1] = False #visited initialized to be False for all habitat
-    
-    for mps in path:
-        found = False
-        for time_bin in shark_dict:
-            if mps.traj_time_stamp >= time_bin[0] and mps.traj_time_stamp <= time_bin[1]:
-                temp_time = time_bin
-                found = True
-                break
-        if not found:
-            continue
-        sharkGrid = shark_dict[temp_time]
-        for cell_bound, prob in sharkGrid.items():
-            if mps.x >= cell_bound[0] and mps.x <= cell_bound[2] and mps.y >= cell_bound[1] and mps.x <= cell_bound[3]:
-                cost[2] += w3 * prob
-                break
+def habitat_shark_cost_arrays(xs, ys, ts, total_traj_time, habitats, shark_dict, weight):
+    '''
+    habitat_shark_cost_func for a path given as numpy arrays of x, y and time stamp
+        points outside of every time bin of shark_dict are left out
 
-        for i in range(len(habitats)):
-            dist = math.sqrt((habitats[i].x-mps.x) **2 + (habitats[i].y-mps.y) **2)
-            if dist <= habitats[i].size:
-                visited[i+1] = True
-                cost[1] += w2
-                break
-    
-    #normalize the cost for time spent in habitats
-    if total_traj_time > 0:
-        cost[1] = cost[1] / total_traj_time
-        cost[2] = cost[2] / total_traj_time
+    habitats: a list of habitat areas represented as motion_plan_states, or a habitat_array
+    shark_dict: a dictionary of time bin -> grid, a TimeBinnedGrids or a DenseGrid
 
-    count = 0 #number of habitats visited
-    for i in range(1, len(visited)+1):
-        if visited[i] == True:
-            count += 1
-    
-    #normalize the cost for number of habitats visited
-    if len(habitats) != 0:
-        cost[0] = w1 * count / len(habitats)
+    output: 
+    cost: [total cost, [cost for w1, cost for w2, ...]]
+    '''
+    habitats = habitat_array(habitats)
+    return path_cost_terms(xs, ys, ts, habitats, shark_dict).cost(total_traj_time, len(habitats), weight)
 
-    return [sum(cost), cost]
+def path_cost_terms(xs, ys, ts, habitats, shark_dict):
+    '''
+    the terms of habitat_shark_cost_func for a part of a path, before they are weighted and normalized
+
+    output: a PathCost
+    '''
+    values, found = timeBinned(shark_dict).valuesAt(xs, ys, ts)
+
+    #a point is in the first habitat that contains it
+    habitats = habitat_array(habitats)
+    xs = np.asarray(xs, dtype = float)[found]
+    ys = np.asarray(ys, dtype = float)[found]
+    inside = np.sqrt((habitats[:, 0] - xs[:, None]) **2 + (habitats[:, 1] - ys[:, None]) **2) <= habitats[:, 2]
+    in_habitat = inside.any(axis = 1)
+
+    visited = 0
+    if in_habitat.any():
+        for i in np.unique(np.argmax(inside[in_habitat], axis = 1)):
+            visited |= 1 << int(i)
+
+    return PathCost(int(in_habitat.sum()), float(values[found].sum()), visited)
+
+class PathCost:
+    '''
+    the terms of habitat_shark_cost_func added up over the points of a path, the cost of a path is the sum of the PathCost of its parts
+        points: number of points inside of a habitat (time spent in habitats)
+        shark: sum of the shark grid values under the points
+        visited: bitmask of the habitats visited, bit i for habitats[i]
+    '''
+    __slots__ = ("points", "shark", "visited")
+
+    def __init__(self, points=0, shark=0.0, visited=0):
+        self.points = points
+        self.shark = shark
+        self.visited = visited
+
+    def add(self, other):
+        '''returns a new PathCost for the points of both parts'''
+        return PathCost(self.points + other.points, self.shark + other.shark, self.visited | other.visited)
+
+    def cost(self, total_traj_time, num_of_habitats, weight):
+        '''
+        weighted and normalized like habitat_shark_cost_func
+
+        output: 
+        cost: [total cost, [cost for w1, cost for w2, ...]]
+        '''
+        #set the weight for each term in cost function
+        w1 = weight[0]
+        w2 = weight[1]
+        w3 = weight[2]
+
+        cost = [0 for _ in range(len(weight))]
+        cost[1] = w2 * self.points
+        cost[2] = w3 * self.shark
+
+        #normalize the cost for time spent in habitats
+        if total_traj_time > 0:
+            cost[1] = cost[1] / total_traj_time
+            cost[2] = cost[2] / total_traj_time
+
+        #number of habitats visited
+        count = bin(self.visited).count("1")
+
+        #normalize the cost for number of habitats visited
+        if num_of_habitats != 0:
+            cost[0] = w1 * count / num_of_habitats
+
+        return [sum(cost), cost]
 
 def habitat_shark_cost_point(mps, habitats, visited, AUVGrid, weight):
     '''
@@ -234,9 +292,12 @@ def habitat_shark_cost_point(mps, habitats, visited, AUVGrid, weight):
                 visited[i] == True
             cost[1] += w2 / len(habitats)
     
-    for cell_bound, prob in AUVGrid.items():
-        if mps.x >= cell_bound[0] and mps.x <= cell_bound[2] and mps.y >= cell_bound[1] and mps.x <= cell_bound[3]:
-            cost[2] += w3 * prob
-            break
+    if hasattr(AUVGrid, "value_at"):
+        cost[2] += w3 * float(AUVGrid.value_at(mps.x, mps.y))
+    else:
+        for cell_bound, prob in AUVGrid.items():
+            if mps.x >= cell_bound[0] and mps.x <= cell_bound[2] and mps.y >= cell_bound[1] and mps.y <= cell_bound[3]:
+                cost[2] += w3 * prob
+                break
 
     return sum(cost), visited
\ No newline at end of file
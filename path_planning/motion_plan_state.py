@@ -17,6 +17,8 @@ class Motion_plan_state:
         self.path = []
         self.length = length
         self.cost = []
+        # cost.PathCost of the path from the root of an RRT tree to this state, without the state itself
+        self.prefix_cost = None
 
     def __repr__(self):
         # goal location in 2D
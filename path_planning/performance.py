@@ -188,7 +188,7 @@ def summary_3(start, goal, boundary, boundary_poly, obstacle_array, habitats, sh
     weights = [weight1, weight2, weight3]
 
     cell_list = splitCell(boundary_poly, 10)
-    sharkGrid = createSharkGrid('path_planning/AUVGrid_prob.csv', cell_list)
+    sharkGrid = SharkOccupancyGrid(10, boundary_poly, 50, 50, cell_list).convert(shark_dict)[1]
     
     for weight in weights:
         result, improvement = summary_2(start, goal, obstacle_array, boundary, habitats, shark_dict, sharkGrid, test_num, plan_time, plot_interval, weight)
@@ -348,6 +348,7 @@ shark_dict2 = {1: [Motion_plan_state(-120 + (0.1 * i), -60 + (0.1 * i), traj_tim
     8: [Motion_plan_state(-250 - (0.1 * i), 75 + (0.1 * i), traj_time_stamp=i) for i in range(1,301)] + [Motion_plan_state(-280 - (0.1 * i), 105 - (0.1 * i), traj_time_stamp=i) for i in range(302,501)],
     9: [Motion_plan_state(-260 - (0.1 * i), 75 + (0.1 * i), traj_time_stamp=i) for i in range(1,301)] + [Motion_plan_state(-290 + (0.08 * i), 105 + (0.07 * i), traj_time_stamp=i) for i in range(302,501)], 
     10: [Motion_plan_state(-275 + (0.1 * i), 80 - (0.1 * i), traj_time_stamp=i) for i in range(1,301)]+ [Motion_plan_state(-245 - (0.13 * i), 50 - (0.12 * i), traj_time_stamp=i) for i in range(302,501)]}
-# sharkGrid1 = createSharkGrid('path_planning/AUVGrid_prob_500_straight.csv', cell_list)
-sharkGrid2 = createSharkGrid('path_planning/shark_data/AUVGrid_prob_500_turn.csv', cell_list)
+# the AUV detecting grids are read from the grid cache after the first run
+# sharkGrid1 = SharkOccupancyGrid(10, boundary_poly, 50, 50, cell_list).convert(shark_dict1)[1]
+sharkGrid2 = SharkOccupancyGrid(10, boundary_poly, 50, 50, cell_list).convert(shark_dict2)[1]
 print(summary_5(obstacles, boundary_poly, habitats, sharkGrid2, cell_list))
\ No newline at end of file
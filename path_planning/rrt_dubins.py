@@ -9,10 +9,10 @@ import numpy as np
 from shapely.geometry import Polygon, Point
 from path_planning.sharkOccupancyGrid import SharkOccupancyGrid
 from motion_plan_state import Motion_plan_state
-from cost import habitat_shark_cost_func
+from cost import habitat_shark_cost_func, habitat_array, path_arrays, path_cost_terms
 import catalina
 
-from sharkOccupancyGrid import SharkOccupancyGrid, splitCell
+from sharkOccupancyGrid import SharkOccupancyGrid, splitCell, splitByTimeBin, timeBinned
 from sharkEstimate import SharkUpdate
 #from shortest_rrt import Shrt_path
 
@@ -46,7 +46,8 @@ class RRT:
 
         # initialize shark occupancy grid
         self.cell_list = cell_list
-        self.sharkGrid = sharkGrid
+        # the grids of a time stamp or an interval are found through the index of the time bins
+        self.sharkGrid = timeBinned(sharkGrid)
 
     def replanning(self, start, habitats, plan_time_budget, traj_time_length, replan_time_interval, weight):
         '''
@@ -104,6 +105,12 @@ class RRT:
 
         self.mps_list = [initial]
 
+        # every node keeps the cost terms of the path from the root to it (prefix_cost), so a new node only adds the points of its steer path
+        #   the shark grid is the view of all the bins from the time of initial, which the interval up to any leaf is part of
+        habitat_list = habitat_array(habitats)
+        shark_grids = self.sharkGrid.interval(initial.traj_time_stamp, math.inf)
+        initial.prefix_cost = path_cost_terms(*path_arrays(self.generate_final_course(initial)[1:]), habitat_list, shark_grids)
+
         self.t_start = time.time()
         n_expand = math.ceil(max_plan_time / plot_interval)
 
@@ -142,6 +149,7 @@ class RRT:
                 
                 if self.check_collision(new_mps, self.obstacle_list):
                     new_mps.parent = closest_mps
+                    new_mps.prefix_cost = closest_mps.prefix_cost.add(path_cost_terms(*path_arrays(new_mps.path), habitat_list, shark_grids))
                     self.mps_list.append(new_mps)
                     #add to time stamp bin
                     if traj_time_stamp:
@@ -156,19 +164,12 @@ class RRT:
                     #        continue    
                     #Question: how to normalize the path length?
                     if new_mps.traj_time_stamp >= max_traj_time-30:
-                        path = self.generate_final_course(new_mps)
-                        #find the corresponding shark occupancy grid
-                        sharkOccupancyDict = {}
-                        start = initial.traj_time_stamp
-                        end = new_mps.traj_time_stamp
-                        for time_bin in self.sharkGrid:
-                            if (start >= time_bin[0] and start <= time_bin[1]) or (time_bin[0] >= start and time_bin[1] <= end) or(end >= time_bin[0] and end <= time_bin[1]):
-                                sharkOccupancyDict[time_bin] = self.sharkGrid[time_bin]
-                            
-                        new_cost = habitat_shark_cost_func(path, new_mps.traj_time_stamp, habitats, sharkOccupancyDict, weights)
+                        #the path generate_final_course gives is new_mps followed by the points of its prefix
+                        path_cost = new_mps.prefix_cost.add(path_cost_terms(*path_arrays([new_mps]), habitat_list, shark_grids))
+                        new_cost = path_cost.cost(new_mps.traj_time_stamp, len(habitat_list), weights)
                         if new_cost[0] < opt_cost[0]:
                             opt_cost = new_cost
-                            opt_path = [new_mps.length, path]
+                            opt_path = [new_mps.length, self.generate_final_course(new_mps)]
                 
             # opt_cost_list.append(opt_cost[0])
         opt_path[1].reverse()
@@ -589,17 +590,9 @@ class RRT:
     
     def splitPath(self, path, shark_interval, traj_time):
         n_expand = math.floor( traj_time[1] / shark_interval)
-        res = {}
         start = traj_time[0]
-        for i in range(n_expand):
-            res[(start + i * shark_interval, start+(i + 1) * shark_interval)] = []
-        
-        for point in path:
-            for time, arr in res.items():
-                if point.traj_time_stamp >= time[0] and point.traj_time_stamp <= time[1]:
-                    arr.append(point)
-                    break
-        return res
+        bin_list = [(start + i * shark_interval, start+(i + 1) * shark_interval) for i in range(n_expand)]
+        return dict(zip(bin_list, splitByTimeBin(path, bin_list)))
     
     def removeHabitat(self, habitats, path):
         for point in path:
@@ -623,6 +616,11 @@ def createSharkGrid(filepath, cell_list):
 
             temp = row["grid"][1:len(row["grid"])-1]
             temp = temp.split(", ")
+            if len(temp) != len(cell_list):
+                # grids exported before splitCell returned a CellRaster have one value per clipped polygon cell,
+                #   they do not line up with the cells of the raster
+                raise ValueError("{} has {} values per grid but cell_list has {} cells, export the grids again with the current cell list"\
+                    .format(filepath, len(temp), len(cell_list)))
             val = {}
             for i in range(len(temp)):
                 val[cell_list[i].bounds] = float(temp[i])
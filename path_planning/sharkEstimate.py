@@ -1,5 +1,6 @@
 from shapely.geometry import Polygon
 import math
+import numpy as np
 
 from sharkOccupancyGrid import SharkOccupancyGrid, splitCell, plotShark
 import catalina as catalina
@@ -19,6 +20,18 @@ class SharkUpdate:
         self.cell_size = cell_size
         self.boundary = boundary
         self.cell_list = cell_list
+
+        # the grids are numpy arrays indexed by [row][col] like cellToIndex, only the cells of cell_list (mask) can be non zero
+        minx, miny, maxx, maxy = self.boundary.bounds
+        self.grid_shape = (int(math.ceil(maxy - miny) / self.cell_size)+1, int(math.ceil(maxx - minx) / self.cell_size)+1)
+        indices = np.array([self.cellToIndex(cell) for cell in self.cell_list], dtype = int).reshape(-1, 2)
+        self.cell_row = indices[:, 0]
+        self.cell_col = indices[:, 1]
+        self.mask = np.zeros(self.grid_shape, dtype = bool)
+        self.mask[self.cell_row, self.cell_col] = True
+        # the transition operator of the random movement model (prediction1) only depends on the cells,
+        #   a shark moves to one of the cells above, below, left or right of it that are in the work space
+        self.num_of_neighbors = self.neighborSum(self.mask.astype(float))
     
     def update(self, curr, sharkGrid, traj_time_length, bin_interval, method):
         '''
@@ -35,24 +48,114 @@ class SharkUpdate:
                 method[0] = "ave" or "hist"
                 method[1] = 1 or 2
 
-        output: updated sharkGrid
+        output: updated sharkGrid, the grids of the future time bins are 2D lists
         '''
         if method[0] == "ave":
-            for _ in range(math.ceil(traj_time_length / bin_interval)):
-                occGridPrev = sharkGrid[curr]
-                occGridCurr = self.predictOnAve(occGridPrev, False, method[1], 0.6, 0.1)
-                curr = (curr[0] + bin_interval, curr[1] + bin_interval)
-                sharkGrid[curr] = occGridCurr
-        
+            gridInf = self.uniformGrid()
         elif method[0] == "hist":
-            for _ in range(math.ceil(traj_time_length / bin_interval)):
-                occGridPrev = sharkGrid[curr]
-                occGridCurr = self.predictOnHist(occGridPrev, False, method[1], sharkGrid[(0, bin_interval)], 0.6, 0.1)
-                curr = (curr[0] + bin_interval, curr[1] + bin_interval)
-                sharkGrid[curr] = occGridCurr
+            gridInf = sharkGrid[(0, bin_interval)]
+        else:
+            raise ValueError("unknown prediction method: " + str(method[0]))
+
+        # all the future bins in one call
+        forecast = self.forecast(sharkGrid[curr], math.ceil(traj_time_length / bin_interval), method[1], 0.6, 0.1, gridInf)
+        for grid in forecast:
+            curr = (curr[0] + bin_interval, curr[1] + bin_interval)
+            sharkGrid[curr] = grid.tolist()
         
         return sharkGrid
 
+    def neighborSum(self, grid):
+        '''
+        sum of the values of the cells above, below, left and right of every cell (0 outside of the grid)
+            the last two axes of grid are the rows and cols, any axes in front of them are a batch of grids
+        '''
+        result = np.zeros(grid.shape)
+        result[..., 1:, :] += grid[..., :-1, :]
+        result[..., :-1, :] += grid[..., 1:, :]
+        result[..., :, 1:] += grid[..., :, :-1]
+        result[..., :, :-1] += grid[..., :, 1:]
+        return result
+
+    def uniformGrid(self):
+        '''
+        shark occupancy grid at infinite time stamp when nothing is known, 1/n for each cell
+        '''
+        return self.mask / max(len(self.cell_row), 1)
+
+    def transition(self, occGridPrev, stayProb):
+        '''
+        one step of the random movement model as a 5-point stencil,
+            P(x'|t) = stayProb * P(x'|t-1) + (1 - stayProb) / number of neighbors of x' * sum of P(j|t-1) of the neighbors j of x'
+
+        parameters:
+            occGridPrev: shark occupancy grid at time stamp t-1, or a batch of grids (..., rows, cols)
+            stayProb: probability the shark will stay in the cell, a number or an array (..., 1, 1) with one value per grid
+
+        output: a numpy array
+        '''
+        occGridPrev = np.asarray(occGridPrev, dtype = float) * self.mask
+        moved = np.divide(self.neighborSum(occGridPrev), self.num_of_neighbors, out = np.zeros(occGridPrev.shape), where = self.num_of_neighbors > 0)
+        return (stayProb * occGridPrev + (1 - stayProb) * moved) * self.mask
+
+    def forecast(self, init_distribution, horizon, method, stayProb, k, gridInf=None):
+        '''
+        predict the shark occupancy grid of the next horizon time bins in one call
+
+        prediction function1: random movement, the stencil of transition applied once per time bin
+        prediction function2: proportional control in closed form, P(x'|t) = P_inf + (1 - k)^t (P(x'|0) - P_inf) for every t at once
+
+        parameters:
+            init_distribution: shark occupancy grid at the current time bin, 2D list or numpy array
+            horizon: number of future time bins
+            method: prediction function 1 or 2
+                stayProb: parameter for method 1
+                k: parameter for method 2
+            gridInf: (optional) shark occupancy grid at infinite time stamp for method 2, defaults to uniformGrid
+
+        output: a numpy array (horizon, rows, cols), the grid of the i-th future time bin is forecast[i - 1]
+        '''
+        return self.forecastBatch(init_distribution, horizon, method, stayProb, k, gridInf)
+
+    def forecastBatch(self, init_distributions, horizon, method, stayProb, k, gridInf=None):
+        '''
+        forecast for a whole batch of scenarios in one pass, e.g. every (scenario, shark) pair of a parameter sweep
+            the batch shape is what init_distributions (without rows and cols), stayProb or k and gridInf (without rows and cols)
+            broadcast to, so one initial distribution can be swept over a vector of k or a stack of priors
+
+        parameters:
+            init_distributions: numpy array (..., rows, cols) of shark occupancy grids at the current time bin
+            horizon: number of future time bins
+            method: prediction function 1 or 2, the same for the whole batch
+                stayProb: parameter for method 1, a number or an array of the batch shape
+                k: parameter for method 2, a number or an array of the batch shape
+            gridInf: (optional) grids at infinite time stamp for method 2, (rows, cols) or (..., rows, cols),
+                e.g. np.stack([self.uniformGrid(), historical grid])[:, None] to compare the "ave" and "hist" priors for every shark
+
+        output: a numpy array (batch shape..., horizon, rows, cols)
+        '''
+        init_distributions = np.asarray(init_distributions, dtype = float)
+        if method == 1:
+            param = np.asarray(stayProb, dtype = float)
+            batch_shape = np.broadcast_shapes(init_distributions.shape[:-2], param.shape)
+            grid = np.broadcast_to(init_distributions, batch_shape + init_distributions.shape[-2:])
+            stayProb = np.broadcast_to(param, batch_shape)[..., None, None]
+
+            forecast = np.empty(batch_shape + (horizon,) + grid.shape[-2:])
+            for step in range(horizon):
+                grid = self.transition(grid, stayProb)
+                forecast[..., step, :, :] = grid
+            return forecast
+
+        if method == 2:
+            param = np.asarray(k, dtype = float)
+            gridInf = self.uniformGrid() if gridInf is None else np.asarray(gridInf, dtype = float)
+            batch_shape = np.broadcast_shapes(init_distributions.shape[:-2], param.shape, gridInf.shape[:-2])
+            decay = (1 - np.broadcast_to(param, batch_shape)[..., None]) ** np.arange(1, horizon + 1)
+            return gridInf[..., None, :, :] + decay[..., None, None] * (init_distributions - gridInf)[..., None, :, :]
+
+        raise ValueError("unknown prediction method: " + str(method))
+
     def prediction1(self, occGridPrev, stayProb):
         '''
         Action update algorithm in Markov Localization, to predict position estimate 
@@ -62,26 +165,7 @@ class SharkUpdate:
             occGridPrev: shark occupancy grid at time stamp t-1
             stayProb: probability the shark will stay in the cell at next time stamp
         '''
-        #initialize the grid, probability initialized to 0
-        minx, miny, maxx, maxy = self.boundary.bounds
-        grid = [[0 for _ in range(int(math.ceil(maxx - minx) / self.cell_size)+1)] for _ in range(int(math.ceil(maxy - miny) / self.cell_size)+1)]
-
-        for cell in self.cell_list:
-            row, col = self.cellToIndex(cell)
-            grid[row][col] = stayProb * occGridPrev[row][col]
-            neighbors = []
-            if (row - 1) >= 0 and grid[row-1][col] != 0:
-                neighbors.append((row-1, col))
-            if (col - 1) >= 0 and grid[row][col-1] != 0:
-                neighbors.append((row, col-1))
-            if (row + 1) < len(grid) and grid[row+1][col] != 0:
-                neighbors.append((row+1, col))
-            if (col + 1) < len(grid[0]) and grid[row][col+1] != 0:
-                neighbors.append((row, col+1))
-            for neighbor in neighbors:
-                grid[row][col] += ((1 - stayProb) / len(neighbors)) * occGridPrev[neighbor[0]][neighbor[1]]
-
-        return grid
+        return self.transition(occGridPrev, stayProb).tolist()
     
     def prediction2(self, occGridPrev, k, gridInf):
         '''
@@ -93,14 +177,7 @@ class SharkUpdate:
             k: hyperparameter to be tuned
             gridInf: shark occupancy grid at infinite time stamp
         '''
-
-        grid = occGridPrev.copy()
-
-        for i in range(len(occGridPrev)):
-            for j in range(len(occGridPrev[i])):
-                grid[i][j] += k * (gridInf[i][j] - occGridPrev[i][j])
-        
-        return grid
+        return self.forecast(occGridPrev, 1, 2, None, k, gridInf)[0].tolist()
     
     def predictOnAve(self, init_distribution, if_exp, method, stayProb, k):
         '''
@@ -121,20 +198,13 @@ class SharkUpdate:
                 stayProb: parameter for method 1
                 k: paramter for method2
         '''
-        #initialize P_inf grid, probability initialized to 1/n
-        minx, miny, maxx, maxy = self.boundary.bounds
-        gridInf = [[0 for _ in range(int(math.ceil(maxx - minx) / self.cell_size)+1)] for _ in range(int(math.ceil(maxy - miny) / self.cell_size)+1)]
-        for cell in self.cell_list:
-            row, col = self.cellToIndex(cell)
-            gridInf[row][col] = 1 / len(self.cell_list)
+        #P_inf grid, probability 1/n for each cell
+        gridInf = self.uniformGrid().tolist()
 
         if if_exp:
-            init_distribution = gridInf.copy()
+            init_distribution = gridInf
         
-        if method == 1:
-            res = self.prediction1(init_distribution, stayProb)
-        if method == 2:
-            res = self.prediction2(init_distribution, k, gridInf)
+        res = self.forecast(init_distribution, 1, method, stayProb, k, gridInf)[0].tolist()
         
         return [init_distribution, res]
     
@@ -160,12 +230,9 @@ class SharkUpdate:
             gridInf: shark occupancy grid from historical data for each cell
         '''
         if if_exp:
-            init_distribution = gridInf.copy()
+            init_distribution = gridInf
         
-        if method == 1:
-            res = self.prediction1(init_distribution, stayProb)
-        if method == 2:
-            res = self.prediction2(init_distribution, k, gridInf)
+        res = self.forecast(init_distribution, 1, method, stayProb, k, gridInf)[0].tolist()
         
         return [init_distribution, res]
 
@@ -180,32 +247,68 @@ class SharkUpdate:
             prediction: shark position estimate x_t at time stamp t 
             particles: the number of particles in each cell 
         '''
-        #initialize the grid, probability initialized to 0.01
-        minx, miny, maxx, maxy = self.boundary.bounds
-        grid = [[0 for _ in range(int(math.ceil(maxx - minx) / self.cell_size)+1)] for _ in range(int(math.ceil(maxy - miny) / self.cell_size)+1)]
-        tempSum = 0
-
-        for cell in self.cell_list:
-            row, col = self.cellToIndex(cell)
-            #likelihood P(z|x) = number of particles in a cell / total number of particles
-            likelihood = particles[row][col] / 1000
-            #prior P(x')
-            prior = prediction[row][col]
-            #P(x|z) = P(z|x) * P(x')
-            grid[row][col] = likelihood * prior
-            tempSum += grid[row][col]
-        
-        for i in range(len(grid)):
-            for j in range(len(grid[i])):
-                grid[i][j] = grid[i][j] / tempSum
+        return self.posterior(particles, prediction).tolist()
+
+    def correctionFromParticles(self, x_p, y_p, prediction, weight_p=None):
+        '''
+        perception update algorithm using Bayes Filter, fed straight from the particles of the particle filter
+            the particles are counted (weighted) in the cells of the grid and used as the likelihood P(z|x)
+
+        parameters:
+            x_p, y_p: numpy arrays of the x and y position of the particles, any number of particles
+            prediction: shark position estimate x_t at time stamp t
+            weight_p: (optional) numpy array of the weight of the particles, every particle counts 1 if not given
+
+        output: a numpy array
+        '''
+        return self.posterior(self.particleHistogram(x_p, y_p, weight_p), prediction)
+
+    def particleHistogram(self, x_p, y_p, weight_p=None):
+        '''
+        sum of the weight of the particles in each cell, particles outside of the cells are left out
+
+        output: a numpy array (rows, cols)
+        '''
+        minx, miny, _, _ = self.boundary.bounds
+        x_p = np.ravel(x_p)
+        y_p = np.ravel(y_p)
+        weight_p = np.ones(len(x_p)) if weight_p is None else np.ravel(weight_p)
+
+        col = np.floor((x_p - minx) / self.cell_size).astype(int)
+        row = np.floor((y_p - miny) / self.cell_size).astype(int)
+        inside = (row >= 0) & (row < self.grid_shape[0]) & (col >= 0) & (col < self.grid_shape[1])
+        inside[inside] = self.mask[row[inside], col[inside]]
+
+        histogram = np.bincount(row[inside] * self.grid_shape[1] + col[inside], weights = weight_p[inside], minlength = self.mask.size)
+        return histogram.reshape(self.grid_shape)
+
+    def posterior(self, particles, prediction):
+        '''
+        P(x|z) = P(z|x) * P(x') normalized over the cells,
+            where the likelihood P(z|x) = particles in a cell / total particles and the prior P(x') = prediction
+            if no particle is in a cell with a prior, the measurement tells nothing and the prior is returned normalized
+
+        parameters:
+            particles: the number (or weight) of particles in each cell
+            prediction: shark position estimate x_t at time stamp t
+        '''
+        particles = np.asarray(particles, dtype = float) * self.mask
+        prior = np.asarray(prediction, dtype = float) * self.mask
+        total = particles.sum()
 
-        return grid
+        grid = prior * particles / total if total > 0 else prior
+        tempSum = grid.sum()
+        if tempSum <= 0:
+            grid = prior
+            tempSum = prior.sum()
+        return grid / tempSum if tempSum > 0 else grid
 
     def cellToIndex(self, cell):
         minx, miny, _, _ = self.boundary.bounds
         lowx, lowy, _, _ = cell.bounds
-        col = int((lowx - minx) / self.cell_size)
-        row = int((lowy - miny) / self.cell_size)
+        # the small offset keeps a cell whose corner is one rounding error below a grid line in the right column / row
+        col = int(math.floor((lowx - minx) / self.cell_size + 1e-9))
+        row = int(math.floor((lowy - miny) / self.cell_size + 1e-9))
         return (row, col)
 
 # boundary_poly = []
@@ -1,4 +1,13 @@
+import bisect
+import hashlib
+import heapq
 import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+from collections.abc import Mapping, MutableMapping
+from functools import lru_cache
 from shapely.geometry import box, Polygon, MultiPolygon, GeometryCollection, Point, LinearRing, LineString, MultiPolygon
 from shapely.ops import split
 import matplotlib.pyplot as plt
@@ -11,6 +20,11 @@ import time
 import catalina
 from motion_plan_state import Motion_plan_state
 
+# grids made by SharkOccupancyGrid.convert are stored here, see GridCache
+GRID_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shark_data", "grid_cache")
+# change this when the way the grids are constructed changes, so the old grids are not used any more
+GRID_CACHE_VERSION = 2
+
 class SharkOccupancyGrid:
     '''
     a class to construct shark occupancy grid maps in each time bin to represent the distribution of shark positions 
@@ -43,16 +57,28 @@ class SharkOccupancyGrid:
         self.bin_interval = bin_interval
         self.detect_range = detect_range
         self.boundary = boundary
+
+        self.buildCellIndex()
     
-    def convert(self, shark_dict):
+    def convert(self, shark_dict, cache=True, num_of_processes=1):
         '''
         convert a dictionary of shark trajectories
             key: shark ID, int
             value: shark trajectory, a list of Motion_plan_state
+
+        the grids are only constructed the first time a set of shark trajectories is converted with the same
+            boundary, cell_size, bin_interval and detect_range, after that they are read from the grid cache
         
-        output: 
-        sharkOccupancy:
-            a dictionary of shark occupancy grid maps
+        cache: (optional) True to use the cache in GRID_CACHE_DIR, a GridCache to use another cache, False to always construct the grids
+        num_of_processes: (optional) the time bins are constructed in a pool of this many processes, None for the number of cpus
+
+        output: (resultArr, resultCell)
+        resultArr:
+            a dictionary of AUV detecting grids
+                key: timebin, tuple(start time, end time)
+                value: the grid during this time bin, a 2D list indexed by [row][col]
+        resultCell:
+            a DenseGrid of the same grids, which can be used as a dictionary of shark occupancy grid maps
                 key: timebin, tuple(start time, end time)
                 value: a dictionary representing occupancy grid of each shark during this time bin
         '''
@@ -61,60 +87,36 @@ class SharkOccupancyGrid:
         self.bin_list = self.createBinList()
         self.timeBinDict = self.convertToTimeBin()
 
+        if cache:
+            grid_cache = cache if isinstance(cache, GridCache) else GridCache()
+            key = self.cacheKey(shark_dict)
+            if key not in grid_cache:
+                grid_cache.save(key, list(self.timeBinDict.keys()), constructGrids(self, self.timeBinDict.values(), num_of_processes))
+            bin_list, grids = grid_cache.loadArrays(key)
+            return (grid_cache.load(key, lambda grid: grid.tolist()), DenseGrid(grids, bin_list, self.boundary, self.cell_size, self.cell_list))
+
+        grids = constructGrids(self, self.timeBinDict.values(), num_of_processes)
         resultArr = {}
-        resultCell = {}
-        for time, traj_dict in self.timeBinDict.items():
-            grid = self.constructGrid(traj_dict)
+        for time, grid in zip(self.timeBinDict.keys(), grids):
             # grid = self.simplifyGrid(grid)
-            resultArr[time] = grid
-            resultCell[time] = self.convert2DArr(grid)
-        return (resultArr, resultCell)
+            resultArr[time] = grid.tolist()
+        return (resultArr, DenseGrid(grids, list(resultArr.keys()), self.boundary, self.cell_size, self.cell_list))
+
+    def cacheKey(self, shark_dict):
+        '''
+        the key of the grids of shark_dict in a GridCache
+        '''
+        return gridCacheKey(shark_dict, self.boundary, self.cell_size, self.bin_interval, self.detect_range, self.cell_row, self.cell_col)
 
     def splitCell(self, geometry, count=0):
-        """Split a Polygon into two parts across it's shortest dimension
+        """split a Polygon into cells of cell_size, returns a CellRaster
         
         parameter:
             geometry: the polygon of configuration space to be splitted into cells
             
-        output: a list of Polygon objects, represented cells in the configuration space
+        output: a CellRaster, which can be used as a list of the cells in the configuration space
         """
-        bounds = geometry.bounds
-        width = bounds[2] - bounds[0]
-        height = bounds[3] - bounds[1]
-
-        if max(width, height) <= self.cell_size or count == 250:
-            # either the polygon is smaller than the cell size, or the maximum
-            # number of recursions has been reached
-            return [geometry]
-
-        if height >= width:
-            # split left to right
-            a = box(bounds[0], bounds[1], bounds[2], bounds[1]+height/2)
-            b = box(bounds[0], bounds[1]+height/2, bounds[2], bounds[3])
-        else:
-            # split top to bottom
-            a = box(bounds[0], bounds[1], bounds[0]+width/2, bounds[3])
-            b = box(bounds[0]+width/2, bounds[1], bounds[2], bounds[3])
-
-        result = []
-        for d in (a, b,):
-            c = geometry.intersection(d)
-            if not isinstance(c, GeometryCollection):
-                c = [c]
-            for e in c:
-                if isinstance(e, (Polygon, MultiPolygon)):
-                    result.extend(self.splitCell(e, count+1))
-        if count > 0:
-            return result
-
-        # convert multipart into singlepart
-        final_result = []
-        for g in result:
-            if isinstance(g, MultiPolygon):
-                final_result.extend(g)
-            else:
-                final_result.append(g)
-        return final_result
+        return splitCell(geometry, self.cell_size)
     
     def constructAllSharkGrid(self, shark_traj_dict):
         '''
@@ -178,7 +180,8 @@ class SharkOccupancyGrid:
             the probability it can detect this shark
             calculated by the sum of shark occupancy of all nearby cells within hydrophone range
         
-        for each cell in the work space, sum up the occupancy of cells within detect_range if AUV resides in this cell
+        for each cell in the work space, sum up the occupancy of cells within detect_range if AUV resides in this cell,
+            which is the occupancy grid convolved with a disk of radius detect_range (in cells)
 
         parameter:
             occGrid: occupancy grid for a single shark during one time bin
@@ -186,22 +189,14 @@ class SharkOccupancyGrid:
         output: an AUV detecting grid representing AUV detecting probability of each cell
             note: AUV detecting probability of each cell should be no larger than 1
         '''
-        minx, miny, maxx, maxy = self.boundary.bounds
-        grid = [[0 for _ in range(int(math.ceil(maxx - minx) / self.cell_size)+1)] for _ in range(int(math.ceil(maxy - miny) / self.cell_size)+1)]
-        count = int(math.ceil(self.detect_range / self.cell_size))
-        for cell in self.cell_list:
-            row, col = self.cellToIndex(cell)
-            row_min, col_min = row - (2*count), col - (2*count)
-            for i in range(2 * (2*count)):
-                row_temp = row_min + i
-                for j in range(2 * 2 * count):
-                    col_temp = col_min + j
-                    if row_temp >=0 and row_temp < len(grid) and col_temp >= 0 and col_temp < len(grid[0]):
-                        if math.sqrt((row_temp - row)**2 + (col_temp - col)**2) <= count:
-                            grid[row][col] += occGrid[row_temp][col_temp]
-            if grid[row][col] > 1:
-                print("problem!", grid[row][col])
-        return grid
+        grid = diskSum(occGrid, self.cell_size, self.detect_range)
+        # only the cells inside the boundary have a detecting probability
+        mask = np.zeros(grid.shape, dtype = bool)
+        mask[self.cell_row, self.cell_col] = True
+        grid[~mask] = 0
+        if (grid > 1 + 1e-9).any():
+            print("problem!", grid.max())
+        return grid.tolist()
     
     def constructSharkOccupancyGrid(self, traj):
         '''
@@ -216,46 +211,49 @@ class SharkOccupancyGrid:
             an occupancy grid representing the occupancy of this shark at each cell during the time bin
         '''
         #initialize the grid, probability initialized to 0.01
-        minx, miny, maxx, maxy = self.boundary.bounds
-        grid = [[0 for _ in range(int(math.ceil(maxx - minx) / self.cell_size)+1)] for _ in range(int(math.ceil(maxy - miny) / self.cell_size)+1)]
-        for cell in self.cell_list:
-            row, col = self.cellToIndex(cell)
-            grid[row][col] = 0.01
+        grid = np.zeros(self.cell_index_shape)
+        grid[self.cell_row, self.cell_col] = 0.01
         
         #normalize factor
-        nor = (len(traj) + len(self.cell_list) * 0.01)
+        nor = (len(traj) + len(self.cell_row) * 0.01)
 
-        #calculate occupancy probability
-        for point in traj:
-            for cell in self.cell_list:
-                point = Point(point.x, point.y)
-                if point.within(cell) or cell.touches(point):
-                    row, col = self.cellToIndex(cell)
-                    grid[row][col] += 1
-                    break
-        
-        temp_sum = 0
-        for i in range(len(grid)):
-            for j in range(len(grid[i])):
-                grid[i][j] = grid[i][j] / nor
-                temp_sum += grid[i][j]
-        # print(temp_sum)
-        return grid
+        #calculate occupancy probability, count the points in each cell with one histogram
+        positions = self.pointsToCells([point.x for point in traj], [point.y for point in traj])
+        positions = positions[positions >= 0]
+        grid += np.bincount(self.cell_slot[positions], minlength = grid.size).reshape(grid.shape)
+
+        return (grid / nor).tolist()
+
+    def buildCellIndex(self):
+        '''
+        index the cells in cell_list with a CellIndex, so points can be put in cells with arithmetic instead of testing every cell
+
+        sets:
+            cell_index: the CellIndex
+            cell_index_shape, cell_row, cell_col, cell_slot: the shape, cell_row, cell_col and cell_slot of cell_index
+        '''
+        self.cell_index = CellIndex(self.cell_list, self.boundary, self.cell_size)
+        self.cell_index_shape = self.cell_index.shape
+        self.cell_row = self.cell_index.cell_row
+        self.cell_col = self.cell_index.cell_col
+        self.cell_slot = self.cell_index.cell_slot
+
+    def pointsToCells(self, x, y):
+        '''
+        find the cell that contains each point with CellIndex.pointsToCells, 
+            a point on the edge between cells goes to the cell that comes first in cell_list
+
+        output: a numpy array of positions in cell_list, -1 for points that are not in any cell
+        '''
+        return self.cell_index.pointsToCells(x, y)
 
     def splitTraj(self, traj):
         '''
         split trajectory based on time bin
-        '''
-        #initialize 
-        new_traj = [[self.bin_list[i]] for i in range(len(self.bin_list))]
 
-        for point in traj:
-            time = point.traj_time_stamp
-            for i in range(len(self.bin_list)):
-                if time >= self.bin_list[i][0] and time <=  self.bin_list[i][1]:
-                    new_traj[i].append(point)
-                    break
-        return new_traj
+        output: a list, one element per time bin: [time bin, points in the time bin...]
+        '''
+        return [[time_bin] + points for time_bin, points in zip(self.bin_list, splitByTimeBin(traj, self.bin_list))]
 
     def convertToTimeBin(self):
         '''
@@ -275,9 +273,8 @@ class SharkOccupancyGrid:
             result[item] = {}
         
         for shark, traj in self.data.items():
-            new_traj_list = self.splitTraj(traj)
-            for new_traj in new_traj_list:
-                result[new_traj[0]][shark] = new_traj[1:]
+            for time_bin, points in zip(self.bin_list, splitByTimeBin(traj, self.bin_list)):
+                result[time_bin][shark] = points
 
         return result
     
@@ -294,8 +291,9 @@ class SharkOccupancyGrid:
     def cellToIndex(self, cell):
         minx, miny, _, _ = self.boundary.bounds
         lowx, lowy, _, _ = cell.bounds
-        col = int((lowx - minx) / self.cell_size)
-        row = int((lowy - miny) / self.cell_size)
+        # the small offset keeps a cell whose corner is one rounding error below a grid line in the right column / row
+        col = int(math.floor((lowx - minx) / self.cell_size + 1e-9))
+        row = int(math.floor((lowy - miny) / self.cell_size + 1e-9))
         return (row, col)
 
     def indexToCell(self, row, col):
@@ -373,36 +371,324 @@ def plotShark(boundary, shark_dict):
     plt.legend()
     plt.show()
 
-def splitCell(polygon, cell_size):
-    minx, miny, maxx, maxy = polygon.bounds
-    horizontal_splitters = []
-    while (miny + cell_size) <= maxy:
-        horizontal_splitters.append(LineString([(minx, miny + cell_size), (maxx, miny + cell_size)]))
-        miny = miny + cell_size
-    vertical_splitters = []
-    minx, miny, maxx, maxy = polygon.bounds
-    while (minx + cell_size) <= maxx:
-        vertical_splitters.append(LineString([(minx + cell_size, miny), (minx + cell_size, maxy)]))
-        minx += cell_size
-
-    splitters = horizontal_splitters + vertical_splitters
-    result = polygon
-    for splitter in splitters:
-        result = MultiPolygon(split(result, splitter))
-        
+@lru_cache(maxsize=None)
+def diskOffsets(cell_size, detect_range):
+    '''
+    the (row, col) offsets of all the cells within detect_range of a cell, cached for each (cell_size, detect_range)
+        a cell is within range if the distance between the cell indices is at most ceil(detect_range / cell_size)
+
+    output: a tuple of (row offset, col offset) tuples
+    '''
+    count = int(math.ceil(detect_range / cell_size))
+    offsets = np.arange(-count, count + 1)
+    row_offset, col_offset = np.meshgrid(offsets, offsets, indexing="ij")
+    inside = np.sqrt(row_offset**2 + col_offset**2) <= count
+    return tuple(zip(row_offset[inside].tolist(), col_offset[inside].tolist()))
+
+class RasterCell:
+    '''
+    a square cell of a CellRaster, it has the same bounds and exterior as the shapely box of the cell
+    '''
+    __slots__ = ("row", "col", "bounds")
+
+    def __init__(self, row, col, bounds):
+        self.row = row
+        self.col = col
+        self.bounds = bounds
+
+    @property
+    def area(self):
+        return (self.bounds[2] - self.bounds[0]) * (self.bounds[3] - self.bounds[1])
+
+    @property
+    def exterior(self):
+        return box(*self.bounds).exterior
+
+    def intersects(self, point):
+        '''True if the point is inside the cell or on its edge'''
+        return self.bounds[0] <= point.x <= self.bounds[2] and self.bounds[1] <= point.y <= self.bounds[3]
+
+class CellRaster:
+    '''
+    the configuration space split into square cells of a regular raster, replaces the list of polygons from splitting the boundary
+
+    the raster starts at the lower left corner of the boundary (origin), row 0 is the bottom row and col 0 is the left column,
+        a cell belongs to the configuration space if its centre is inside the boundary (inside mask)
+
+    it can be used like the old list of cells: len, iterating and indexing give RasterCell objects 
+        ordered by row then col, whose bounds are the same tuples that cell.bounds used to give
+    '''
+    def __init__(self, polygon, cell_size):
+        self.cell_size = cell_size
+        self.minx, self.miny, maxx, maxy = polygon.bounds
+        self.num_rows = max(1, int(math.ceil((maxy - self.miny) / cell_size)))
+        self.num_cols = max(1, int(math.ceil((maxx - self.minx) / cell_size)))
+
+        centre_y, centre_x = np.meshgrid(self.miny + (np.arange(self.num_rows) + 0.5) * cell_size,\
+            self.minx + (np.arange(self.num_cols) + 0.5) * cell_size, indexing="ij")
+        self.inside = pointsInPolygon(centre_x, centre_y, polygon)
+        self.rows, self.cols = np.nonzero(self.inside)
+        # position of every (row, col) in the list of cells, -1 for cells outside the boundary
+        self.position = np.full(self.inside.shape, -1)
+        self.position[self.rows, self.cols] = np.arange(len(self.rows))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, position):
+        row, col = int(self.rows[position]), int(self.cols[position])
+        return RasterCell(row, col, self.indexToCell(row, col))
+
+    def __iter__(self):
+        for position in range(len(self.rows)):
+            yield self[position]
+
+    def indexToCell(self, row, col):
+        '''returns the bounds (minx, miny, maxx, maxy) of the cell at (row, col)'''
+        lowx = self.minx + col * self.cell_size
+        lowy = self.miny + row * self.cell_size
+        return (lowx, lowy, lowx + self.cell_size, lowy + self.cell_size)
+
+    def cellToIndex(self, cell):
+        '''returns (row, col) of a cell, or of a cell.bounds tuple'''
+        if isinstance(cell, RasterCell):
+            return (cell.row, cell.col)
+        lowx, lowy, _, _ = cell if isinstance(cell, tuple) else cell.bounds
+        return (int(round((lowy - self.miny) / self.cell_size)), int(round((lowx - self.minx) / self.cell_size)))
+
+    def pointToIndex(self, x, y):
+        '''returns (row, col) numpy arrays of the cells that contain the points, they can be outside of the raster'''
+        col = np.floor((np.asarray(x, dtype = float) - self.minx) / self.cell_size).astype(int)
+        row = np.floor((np.asarray(y, dtype = float) - self.miny) / self.cell_size).astype(int)
+        return (row, col)
+
+class CellIndex:
+    '''
+    finds the cell of a cell list that contains a point by index arithmetic,
+        on the raster of cell_size squares that starts at the lower left corner of the boundary
+
+    a point on the edge between cells (or on a corner) touches the cells on both sides of it, 
+        it goes to the one of them that comes first in the cell list, for a CellRaster the cell below / left of the edge,
+        the same cell that testing "point.within(cell) or cell.touches(point)" for every cell in order finds
+    '''
+
+    def __init__(self, cell_list, boundary, cell_size):
+        '''
+        parameters:
+            cell_list: a CellRaster, or a list of square cells of cell_size on the raster
+            boundary: the Polygon of the configuration space
+            cell_size: cell size in meters
+
+        sets:
+            shape: (rows, cols) of the grids of SharkOccupancyGrid
+            cell_row, cell_col: numpy arrays, (row, col) of every cell, same as cellToIndex
+            cell_slot: numpy array, row * number of columns + col of every cell
+            cell_bounds: numpy array (number of cells, 4), minx, miny, maxx, maxy of every cell
+            position: 2D numpy array, position in the cell list of the cell at (row, col), -1 where there is no cell
+        '''
+        self.minx, self.miny, maxx, maxy = boundary.bounds
+        self.cell_size = cell_size
+        self.shape = (int(math.ceil(maxy - self.miny) / cell_size)+1, int(math.ceil(maxx - self.minx) / cell_size)+1)
+
+        if isinstance(cell_list, CellRaster):
+            self.cell_row = np.asarray(cell_list.rows, dtype = int)
+            self.cell_col = np.asarray(cell_list.cols, dtype = int)
+            lowx = cell_list.minx + self.cell_col * cell_size
+            lowy = cell_list.miny + self.cell_row * cell_size
+            self.cell_bounds = np.column_stack((lowx, lowy, lowx + cell_size, lowy + cell_size))
+        else:
+            self.cell_bounds = np.array([cell.bounds for cell in cell_list], dtype = float).reshape(-1, 4)
+            # the small offset keeps a cell whose corner is one rounding error below a grid line in the right column / row
+            self.cell_col = np.floor((self.cell_bounds[:, 0] - self.minx) / cell_size + 1e-9).astype(int)
+            self.cell_row = np.floor((self.cell_bounds[:, 1] - self.miny) / cell_size + 1e-9).astype(int)
+        self.cell_slot = self.cell_row * self.shape[1] + self.cell_col
+
+        self.position = np.full(self.shape, -1)
+        # filled backwards, so the first of two cells at the same (row, col) is kept
+        self.position[self.cell_row[::-1], self.cell_col[::-1]] = np.arange(len(self.cell_row))[::-1]
+
+    def pointsToCells(self, x, y):
+        '''
+        find the cell that contains each point
+
+        parameters:
+            x, y: lists or numpy arrays of the point positions
+
+        output: a numpy array of positions in the cell list, -1 for points that are not in any cell
+        '''
+        x = np.asarray(x, dtype = float)
+        y = np.asarray(y, dtype = float)
+        square_x = (x - self.minx) / self.cell_size
+        square_y = (y - self.miny) / self.cell_size
+
+        # a point within a rounding error of a grid line can be in the squares on both sides of it,
+        #   the cells of the (up to 4) squares are tested against the bounds of the cells and the first one that contains the point wins
+        result = np.full(x.shape, len(self.cell_row))
+        for row in (np.floor(square_y - 1e-6).astype(int), np.floor(square_y + 1e-6).astype(int)):
+            for col in (np.floor(square_x - 1e-6).astype(int), np.floor(square_x + 1e-6).astype(int)):
+                inside = (row >= 0) & (row < self.shape[0]) & (col >= 0) & (col < self.shape[1])
+                position = np.where(inside, self.position[np.where(inside, row, 0), np.where(inside, col, 0)], -1)
+                bounds = self.cell_bounds[np.maximum(position, 0)]
+                contains = (position >= 0) & (bounds[..., 0] <= x) & (x <= bounds[..., 2]) & (bounds[..., 1] <= y) & (y <= bounds[..., 3])
+                result = np.where(contains, np.minimum(result, position), result)
+        return np.where(result < len(self.cell_row), result, -1)
+
+def pointsInPolygon(x, y, polygon):
+    '''
+    vectorized even-odd ray casting, returns a boolean numpy array that is True for the points inside the polygon
+
+    parameters:
+        x, y: numpy arrays of point positions
+        polygon: a shapely Polygon (holes are supported) or MultiPolygon
+    '''
+    x = np.asarray(x, dtype = float)
+    y = np.asarray(y, dtype = float)
+    inside = np.zeros(x.shape, dtype = bool)
+    polygons = polygon.geoms if isinstance(polygon, MultiPolygon) else [polygon]
+    for part in polygons:
+        for ring in [part.exterior] + list(part.interiors):
+            coords = np.asarray(ring.coords)
+            for (x1, y1), (x2, y2) in zip(coords[:-1], coords[1:]):
+                if y1 == y2:
+                    continue
+                crosses = ((y1 > y) != (y2 > y)) & (x < (x2 - x1) * (y - y1) / (y2 - y1) + x1)
+                inside ^= crosses
+    return inside
+
+# set in every process of the pool of constructGrids
+_pool_occupancy_grid = None
+_pool_grids = None
+
+def _initGridPool(sharkOccupancyGrid, shared_grids, shape):
+    '''keeps the SharkOccupancyGrid and a numpy view of the shared grids in a process of the pool'''
+    global _pool_occupancy_grid, _pool_grids
+    _pool_occupancy_grid = sharkOccupancyGrid
+    _pool_grids = np.frombuffer(shared_grids, dtype = float).reshape(shape)
+
+def _constructGridJob(job):
+    '''constructs the grid of one time bin straight into the shared grids'''
+    index, traj_dict = job
+    _pool_grids[index] = _pool_occupancy_grid.constructGrid(traj_dict)
+    return index
+
+def constructGrids(sharkOccupancyGrid, traj_dicts, num_of_processes = 1):
+    '''
+    construct the AUV detecting grids of many time bins, the time bins do not depend on each other so they can be
+        constructed in a process pool, every process writes its grids into one block of shared memory
+        so only the trajectories are sent to the processes and nothing large is sent back
+
+    parameters:
+        sharkOccupancyGrid: the SharkOccupancyGrid that constructs the grids (constructGrid)
+        traj_dicts: a list of dictionaries of shark trajectories, one per time bin, like the values of convertToTimeBin
+        num_of_processes: (optional) size of the process pool, None for the number of cpus, 1 constructs the grids in this process
+
+    output: a numpy array (number of time bins, rows, cols)
+    '''
+    traj_dicts = list(traj_dicts)
+    shape = (len(traj_dicts),) + tuple(sharkOccupancyGrid.cell_index_shape)
+    if num_of_processes == 1 or len(traj_dicts) <= 1:
+        grids = np.zeros(shape)
+        for index, traj_dict in enumerate(traj_dicts):
+            grids[index] = sharkOccupancyGrid.constructGrid(traj_dict)
+        return grids
+
+    shared_grids = multiprocessing.RawArray("d", int(np.prod(shape)))
+    num_of_processes = min(num_of_processes or multiprocessing.cpu_count(), len(traj_dicts))
+    with multiprocessing.Pool(num_of_processes, initializer = _initGridPool, initargs = (sharkOccupancyGrid, shared_grids, shape)) as pool:
+        for _ in pool.imap_unordered(_constructGridJob, enumerate(traj_dicts)):
+            pass
+    return np.frombuffer(shared_grids, dtype = float).reshape(shape).copy()
+
+def diskSum(grid, cell_size, detect_range):
+    '''
+    sum up the values of all cells within detect_range of each cell, the grid convolved with a disk of diskOffsets
+
+    parameters:
+        grid: 2D list or numpy array
+
+    output: a numpy array of the same shape
+    '''
+    grid = np.asarray(grid, dtype = float)
+    result = np.zeros(grid.shape)
+    num_rows, num_cols = grid.shape
+    # add the grid shifted by every (row, col) offset of the disk
+    for row_offset, col_offset in diskOffsets(cell_size, detect_range):
+        result[max(0, -row_offset):min(num_rows, num_rows - row_offset), max(0, -col_offset):min(num_cols, num_cols - col_offset)] +=\
+            grid[max(0, row_offset):min(num_rows, num_rows + row_offset), max(0, col_offset):min(num_cols, num_cols + col_offset)]
     return result
 
+def binTimes(times, bin_list):
+    '''
+    find the time bin of each time stamp with a single searchsorted on the sorted bin edges
+
+    the bins are closed intervals that follow each other, a time on the edge between two bins goes to the earlier bin,
+        the same bin that checking "time >= bin[0] and time <= bin[1]" for every bin in order finds
+
+    parameters:
+        times: list or numpy array of time stamps
+        bin_list: a sorted list of time bins, tuple(start time, end time), each bin starts where the previous one ends
+
+    output: a numpy array, index of the time bin of each time stamp in bin_list, -1 for times outside of every bin
+    '''
+    times = np.asarray(times, dtype = float)
+    if len(bin_list) == 0:
+        return np.full(times.shape, -1)
+    bin_start = np.array([time_bin[0] for time_bin in bin_list], dtype = float)
+    bin_end = np.array([time_bin[1] for time_bin in bin_list], dtype = float)
+    index = np.searchsorted(bin_end, times, side="left")
+    index_inside = np.minimum(index, len(bin_list) - 1)
+    inside = (index < len(bin_list)) & (times >= bin_start[index_inside])
+    return np.where(inside, index, -1)
+
+def splitByTimeBin(traj, bin_list):
+    '''
+    split a trajectory into time bins, same rules as binTimes
+
+    parameters:
+        traj: a list of motion_plan_state
+        bin_list: a sorted list of time bins, tuple(start time, end time), each bin starts where the previous one ends
+
+    output: a list with one list of motion_plan_state per time bin, the points keep their order in the trajectory
+        when the trajectory is sorted by time (the usual case), each list is a slice of the trajectory
+    '''
+    times = np.array([point.traj_time_stamp for point in traj], dtype = float)
+    if len(bin_list) == 0:
+        return []
+    if np.all(np.diff(times) >= 0):
+        bin_start = np.array([time_bin[0] for time_bin in bin_list], dtype = float)
+        bin_end = np.array([time_bin[1] for time_bin in bin_list], dtype = float)
+        # a bin ends after the last point at or before its end time, the next bin starts there
+        ends = np.searchsorted(times, bin_end, side="right")
+        starts = np.concatenate(([np.searchsorted(times, bin_start[0], side="left")], ends[:-1]))
+        return [traj[start:end] for start, end in zip(starts, ends)]
+
+    bin_index = binTimes(times, bin_list)
+    order = np.argsort(bin_index, kind="stable")
+    edges = np.searchsorted(bin_index[order], np.arange(len(bin_list) + 1), side="left")
+    return [[traj[j] for j in order[edges[i]:edges[i+1]]] for i in range(len(bin_list))]
+
+def splitCell(polygon, cell_size):
+    '''
+    split the configuration space into square cells
+
+    parameters:
+        polygon: the boundary of the configuration space
+        cell_size: side length of the cells, in meters
+
+    output: a CellRaster, which can be used as a list of cells
+    '''
+    return CellRaster(polygon, cell_size)
+
 def getGridByTime(time, gridDict):
     '''
     Given a specific time stamp, find the corresponding shark occupancy grid / AUV detecting grid in the dictionary
 
     parameters:
         time: time stamp
-        gridDict: a dictionary, whose key is time bin and value is the corresponding grid during this time bin
+        gridDict: a TimeBinnedGrids or a DenseGrid, whose key is time bin and value is the corresponding grid during this time bin,
+            make it once with timeBinned and use it for every look up
     '''
-    for timebin, grid in gridDict.items():
-        if time >= timebin[0] and time <= timebin[1]:
-            return grid
+    return indexedGrids(gridDict).gridAt(time)
 
 def getGridByInterval(interval, gridDict):
     '''
@@ -410,17 +696,721 @@ def getGridByInterval(interval, gridDict):
 
     parameters:
         interval: time interval
-        gridDict: a dictionary, whose key is time bin and value is the corresponding grid during this time bin
+        gridDict: a TimeBinnedGrids or a DenseGrid, whose key is time bin and value is the corresponding grid during this time bin
     
     output:
-        res: a distionary consisting of all grids in this interval
+        res: a TimeBinnedGrids view of all grids in this interval, the grids are not copied
     '''
-    res = {}    
-    for time_bin in gridDict:
-        if (interval[0] >= time_bin[0] and interval[0] <= time_bin[1]) or (time_bin[0] >= interval[0] and time_bin[1] <= interval[1]) or(interval[1] >= time_bin[0] and interval[1] <= time_bin[1]):
-            res[time_bin] = gridDict[time_bin]
-    
-    return res
+    return indexedGrids(gridDict).interval(interval[0], interval[1])
+
+def indexedGrids(gridDict):
+    '''
+    returns gridDict as a TimeBinnedGrids without sorting its time bins again,
+        a plain dictionary raises a TypeError, sorting its bins for a single look up costs more than walking through them
+    '''
+    if getattr(gridDict, "time_index", None) is None:
+        raise TypeError("the grids need a time index, make a TimeBinnedGrids with timeBinned once and reuse it")
+    return timeBinned(gridDict)
+
+class TimeBinIndex:
+    '''
+    finds the time bins of time stamps and time intervals without walking through every time bin
+
+    the bins are sorted by start time and must not overlap, a time stamp on the edge between two bins goes to the earlier bin,
+        the same bin that checking "time >= bin[0] and time <= bin[1]" for every bin in order finds
+    regular bins (all of the same length, each one starting where the previous one ends) are found arithmetically,
+        other bins by binary search
+    '''
+
+    def __init__(self, bin_list):
+        self.bin_list = sorted(tuple(time_bin) for time_bin in bin_list)
+        self.position = {time_bin: i for i, time_bin in enumerate(self.bin_list)}
+        self.bin_start = [time_bin[0] for time_bin in self.bin_list]
+        self.bin_end = [time_bin[1] for time_bin in self.bin_list]
+        self.width = None
+        if len(self.bin_list) > 0:
+            width = self.bin_end[0] - self.bin_start[0]
+            if width > 0 and all(end - start == width for start, end in self.bin_list)\
+                and all(start == end for start, end in zip(self.bin_start[1:], self.bin_end[:-1])):
+                self.width = width
+
+    def __len__(self):
+        return len(self.bin_list)
+
+    def index(self, time):
+        '''
+        position of the bin of a time stamp in bin_list, -1 if the time is outside of every bin
+        '''
+        num_of_bins = len(self.bin_list)
+        if num_of_bins == 0:
+            return -1
+        if self.width is not None:
+            i = min(max(int(math.ceil((time - self.bin_start[0]) / self.width)) - 1, 0), num_of_bins - 1)
+            # the division can round to the wrong side of an edge, check against the real edges
+            if time > self.bin_end[i] and i < num_of_bins - 1:
+                i += 1
+            elif i > 0 and time <= self.bin_end[i - 1]:
+                i -= 1
+        else:
+            i = bisect.bisect_left(self.bin_end, time)
+            if i == num_of_bins:
+                return -1
+        if self.bin_start[i] <= time <= self.bin_end[i]:
+            return i
+        return -1
+
+    def indices(self, times):
+        '''
+        index for a numpy array of time stamps, returns a numpy array with -1 for the times outside of every bin
+        '''
+        times = np.asarray(times, dtype = float)
+        if len(self.bin_list) == 0:
+            return np.full(times.shape, -1)
+        i = np.searchsorted(self.bin_end, times, side="left")
+        i_inside = np.minimum(i, len(self.bin_list) - 1)
+        inside = (i < len(self.bin_list)) & (times >= np.asarray(self.bin_start)[i_inside])
+        return np.where(inside, i, -1)
+
+    def overlapping(self, start, end):
+        '''
+        the bins that share at least one time with [start, end] are bin_list[first:last], returns (first, last)
+        '''
+        first = bisect.bisect_left(self.bin_end, start)
+        last = bisect.bisect_right(self.bin_start, end)
+        return (first, max(first, last))
+
+class TimeBinnedGrids(Mapping):
+    '''
+    a dictionary of time bin -> grid (like the ones returned by convert) together with a TimeBinIndex of its bins,
+        so the grid of a time stamp or the grids of an interval are found without walking through every bin
+
+    interval returns a view of some of the bins, which shares the grids with the whole dictionary
+    '''
+
+    def __init__(self, grids, time_index=None, first=0, last=None):
+        '''
+        parameters:
+            grids: a dictionary of time bin -> grid, a DenseGrid or a CachedGrids
+            time_index: (optional) the TimeBinIndex of the bins of grids
+            first, last: (optional) only the bins time_index.bin_list[first:last] are in the view
+        '''
+        self.grids = grids
+        if time_index is None:
+            time_index = getattr(grids, "time_index", None) or TimeBinIndex(list(grids))
+        self.time_index = time_index
+        self.first = first
+        self.last = len(time_index) if last is None else last
+
+    def binAt(self, time):
+        '''
+        the time bin of a time stamp, None if it is not in any bin of this view
+        '''
+        i = self.time_index.index(time)
+        if self.first <= i < self.last:
+            return self.time_index.bin_list[i]
+        return None
+
+    def gridAt(self, time):
+        '''
+        the grid of the bin of a time stamp, None if it is not in any bin of this view
+        '''
+        time_bin = self.binAt(time)
+        return None if time_bin is None else self.grids[time_bin]
+
+    def interval(self, start, end):
+        '''
+        a view of the bins that share at least one time with [start, end]
+        '''
+        first, last = self.time_index.overlapping(start, end)
+        return TimeBinnedGrids(self.grids, self.time_index, max(first, self.first), min(last, self.last))
+
+    def valuesAt(self, xs, ys, ts):
+        '''
+        the grid values under the points (xs, ys) at the time stamps ts, found by index arithmetic into dense rasters
+            a DenseGrid is looked up in one step, other grids are turned into a raster (gridRaster) for each time bin the points are in
+            a point on the edge between two cells uses the cell above / right of it, like DenseGrid.value_at
+
+        parameters:
+            xs, ys, ts: numpy arrays of the same shape
+
+        output: (values, found) numpy arrays, values is 0 and found is False for the points outside of every time bin of this view
+        '''
+        xs = np.asarray(xs, dtype = float)
+        ys = np.asarray(ys, dtype = float)
+        ts = np.asarray(ts, dtype = float)
+        index = self.time_index.indices(ts)
+        # a time stamp on the start of the first bin of the view is on the end of the bin before it, which is not in the view
+        if 0 < self.first < self.last:
+            index[(index == self.first - 1) & (ts == self.time_index.bin_start[self.first])] = self.first
+        found = (index >= self.first) & (index < self.last)
+        values = np.zeros(xs.shape)
+        if not found.any():
+            return values, found
+
+        if isinstance(self.grids, DenseGrid):
+            row, col, inside = self.grids.pointToIndex(xs, ys)
+            inside &= found
+            values[inside] = self.grids.values[self.grids.time_order[index[inside]], row[inside], col[inside]]
+            return values, found
+
+        for i in np.unique(index[found]):
+            in_bin = index == i
+            grid = self.grids[self.time_index.bin_list[i]]
+            if hasattr(grid, "value_at"):
+                values[in_bin] = grid.value_at(xs[in_bin], ys[in_bin])
+                continue
+            raster, minx, miny, cell_size = gridRaster(grid)
+            col = np.floor((xs[in_bin] - minx) / cell_size).astype(int)
+            row = np.floor((ys[in_bin] - miny) / cell_size).astype(int)
+            inside = (row >= 0) & (row < raster.shape[0]) & (col >= 0) & (col < raster.shape[1])
+            bin_values = np.zeros(len(row))
+            bin_values[inside] = raster[row[inside], col[inside]]
+            values[in_bin] = bin_values
+        return values, found
+
+    def __getitem__(self, time_bin):
+        if not self.first <= self.time_index.position.get(time_bin, -1) < self.last:
+            raise KeyError(time_bin)
+        return self.grids[time_bin]
+
+    def __iter__(self):
+        return iter(self.time_index.bin_list[self.first:self.last])
+
+    def __len__(self):
+        return max(self.last - self.first, 0)
+
+def timeBinned(grids):
+    '''
+    returns grids as a TimeBinnedGrids, grids that already are one are returned as they are
+    '''
+    return grids if isinstance(grids, TimeBinnedGrids) else TimeBinnedGrids(grids)
+
+def gridRaster(grid):
+    '''
+    a dictionary of cell.bounds -> probability as a dense raster, the cells have to be squares of the same size on a regular raster
+
+    output: (raster, minx, miny, cell_size), the cell at raster[row][col] starts at (minx + col * cell_size, miny + row * cell_size)
+    '''
+    if len(grid) == 0:
+        return np.zeros((0, 0)), 0, 0, 1
+    bounds = np.array(list(grid.keys()), dtype = float).reshape(-1, 4)
+    probs = np.fromiter(grid.values(), dtype = float, count = len(grid))
+    cell_size = bounds[0][2] - bounds[0][0]
+    minx, miny = bounds[:, 0].min(), bounds[:, 1].min()
+    col = np.round((bounds[:, 0] - minx) / cell_size).astype(int)
+    row = np.round((bounds[:, 1] - miny) / cell_size).astype(int)
+    raster = np.zeros((row.max() + 1, col.max() + 1))
+    raster[row, col] = probs
+    return raster, minx, miny, cell_size
+
+def gridCacheKey(shark_dict, boundary, cell_size, bin_interval, detect_range, cell_row=(), cell_col=()):
+    '''
+    a hash of everything the grids made by SharkOccupancyGrid.convert depend on, used as the name of the grids in a GridCache
+
+    parameters:
+        shark_dict: a dictionary of shark trajectories, key is shark_id and value is a list of Motion_plan_state
+        boundary: the Polygon of the configuration space
+        cell_size, bin_interval, detect_range: same as SharkOccupancyGrid
+        cell_row, cell_col: (optional) row and col of every cell, the grids are only non zero in these cells
+    '''
+    key = hashlib.sha256()
+    key.update(repr((GRID_CACHE_VERSION, float(cell_size), float(bin_interval), float(detect_range))).encode())
+    key.update(boundary.wkb)
+    key.update(np.asarray(cell_row, dtype=np.int64).tobytes())
+    key.update(np.asarray(cell_col, dtype=np.int64).tobytes())
+    for shark_id in sorted(shark_dict):
+        traj = np.array([(mps.x, mps.y, mps.traj_time_stamp) for mps in shark_dict[shark_id]], dtype=float)
+        key.update(repr((shark_id, len(traj))).encode())
+        key.update(traj.tobytes())
+    return key.hexdigest()
+
+class GridCache:
+    '''
+    an on-disk cache of the grids made by SharkOccupancyGrid.convert
+
+    the grids of each key are stored in a directory named after the key:
+        bins.npy: (number of time bins, 2) start and end time of every time bin
+        grids.npy: (number of time bins, rows, cols) float32, the grid of every time bin, the same dtype as DenseGrid
+    '''
+
+    def __init__(self, cache_dir=GRID_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self.path(key), "grids.npy"))
+
+    def save(self, key, bin_list, grids):
+        '''
+        store the grids under key, the files are written to a temporary directory first,
+            so the grids of a key are either all there or not there at all
+
+        parameters:
+            bin_list: a list of time bins, tuple(start time, end time)
+            grids: a list of 2D grids, one per time bin
+        '''
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = tempfile.mkdtemp(dir=self.cache_dir)
+        np.save(os.path.join(temp_path, "bins.npy"), np.array(bin_list).reshape(len(bin_list), 2))
+        np.save(os.path.join(temp_path, "grids.npy"), np.array(grids, dtype=np.float32))
+        try:
+            os.rename(temp_path, self.path(key))
+        except OSError:
+            # another process has stored the same grids first
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+    def load(self, key, to_value=None):
+        '''
+        returns a CachedGrids of the grids stored under key, nothing is read until the grids are used
+
+        parameters:
+            to_value: (optional) a function applied to the 2D numpy array of a time bin, its result is what the CachedGrids returns
+        '''
+        return CachedGrids(self.path(key), to_value)
+
+    def loadArrays(self, key):
+        '''
+        returns (bin_list, grids) stored under key, grids is a memory mapped numpy array
+        '''
+        bins = np.load(os.path.join(self.path(key), "bins.npy"))
+        return [tuple(time_bin) for time_bin in bins.tolist()], np.load(os.path.join(self.path(key), "grids.npy"), mmap_mode="r")
+
+class CachedGrids(MutableMapping):
+    '''
+    a dictionary of time bin -> grid, backed by the files of a GridCache
+
+    the files are memory mapped the first time the dictionary is used, and a time bin is only read and
+        converted with to_value when it is looked up
+    values that are assigned are kept in memory, the files are never changed
+    '''
+
+    def __init__(self, path, to_value=None):
+        self.path = path
+        self.to_value = to_value
+        self.bin_index = None
+        self.grids = None
+        self.values = {}
+
+    def load(self):
+        if self.bin_index is None:
+            bins = np.load(os.path.join(self.path, "bins.npy"))
+            self.grids = np.load(os.path.join(self.path, "grids.npy"), mmap_mode="r")
+            self.bin_index = {tuple(time_bin): i for i, time_bin in enumerate(bins.tolist())}
+
+    def __getitem__(self, time_bin):
+        if time_bin not in self.values:
+            self.load()
+            grid = self.grids[self.bin_index[time_bin]]
+            self.values[time_bin] = self.to_value(grid) if self.to_value else grid
+        return self.values[time_bin]
+
+    def __setitem__(self, time_bin, value):
+        self.load()
+        if time_bin not in self.bin_index:
+            self.bin_index[time_bin] = None
+        self.values[time_bin] = value
+
+    def __delitem__(self, time_bin):
+        self.load()
+        del self.bin_index[time_bin]
+        self.values.pop(time_bin, None)
+
+    def __iter__(self):
+        self.load()
+        return iter(self.bin_index)
+
+    def __len__(self):
+        self.load()
+        return len(self.bin_index)
+
+class DenseGrid(Mapping):
+    '''
+    the AUV detecting grids of every time bin in a single (time bin, row, col) float32 array
+
+    value_at finds the grid value under any number of points by index arithmetic instead of searching the cells
+    it can still be used like the dictionary of cell dictionaries that convert used to return:
+        key: time bin, tuple(start time, end time)
+        value: a DenseGridBin, which maps cell.bounds to the probability of the cell, like convert2DArr
+    '''
+
+    def __init__(self, values, bin_list, boundary, cell_size, cell_list):
+        '''
+        parameters:
+            values: (number of time bins, rows, cols) grids, row and col of a cell are the same as SharkOccupancyGrid.cellToIndex
+            bin_list: a sorted list of time bins, tuple(start time, end time), one per grid
+            boundary: the Polygon of the configuration space
+            cell_size: cell size in meters
+            cell_list: the cells of the configuration space, only these cells show up when the grid is used as a dictionary
+        '''
+        # a float32 array, like the memory mapped grids of GridCache.loadArrays, is kept as it is without reading it
+        self.values = values if isinstance(values, np.ndarray) and values.dtype == np.float32 else np.asarray(values, dtype=np.float32)
+        if self.values.ndim != 3:
+            self.values = self.values.reshape(len(bin_list), 0, 0)
+        self.bin_list = [tuple(time_bin) for time_bin in bin_list]
+        self.bin_index = {time_bin: i for i, time_bin in enumerate(self.bin_list)}
+        self.time_index = TimeBinIndex(self.bin_list)
+        # position of each bin of time_index in bin_list
+        self.time_order = np.array([self.bin_index[time_bin] for time_bin in self.time_index.bin_list], dtype = int)
+        self.minx, self.miny, _, _ = boundary.bounds
+        self.cell_size = cell_size
+
+        self.cell_bounds = [cell.bounds for cell in cell_list]
+        lows = np.array([bounds[:2] for bounds in self.cell_bounds], dtype=float).reshape(-1, 2)
+        # same as cellToIndex
+        self.cell_col = np.floor((lows[:, 0] - self.minx) / cell_size + 1e-9).astype(int)
+        self.cell_row = np.floor((lows[:, 1] - self.miny) / cell_size + 1e-9).astype(int)
+        self.bounds_index = {bounds: i for i, bounds in enumerate(self.cell_bounds)}
+        # index of a time bin -> GridPyramid, made the first time the bin is queried
+        self.pyramids = {}
+
+    def pyramid(self, time_bin):
+        '''
+        the GridPyramid of a time bin, for region queries, it is only built once per time bin
+        '''
+        index = self.bin_index[time_bin]
+        if index not in self.pyramids:
+            self.pyramids[index] = GridPyramid(self.values[index], self.minx, self.miny, self.cell_size,\
+                self.values[index][self.cell_row, self.cell_col])
+        return self.pyramids[index]
+
+    def pointToIndex(self, xs, ys):
+        '''
+        returns (row, col, inside) numpy arrays for the points, inside is False for points outside of the grid
+        '''
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        col = np.floor((xs - self.minx) / self.cell_size).astype(int)
+        row = np.floor((ys - self.miny) / self.cell_size).astype(int)
+        inside = (row >= 0) & (row < self.values.shape[1]) & (col >= 0) & (col < self.values.shape[2])
+        return row, col, inside
+
+    def value_at(self, xs, ys, ts):
+        '''
+        the grid values under the points (xs, ys) at the time stamps ts, 0 outside of the grid or outside of every time bin
+            a time stamp on the edge between two time bins uses the earlier bin, like TimeBinIndex
+
+        parameters:
+            xs, ys, ts: numbers or numpy arrays of the same shape (or shapes that can be broadcast together)
+
+        output: a numpy float32 array of the shape of the points
+        '''
+        xs, ys, ts = np.broadcast_arrays(np.asarray(xs, dtype=float), np.asarray(ys, dtype=float), np.asarray(ts, dtype=float))
+        bin_index = self.time_index.indices(ts)
+        row, col, inside = self.pointToIndex(xs, ys)
+        inside &= bin_index >= 0
+        bin_index = self.time_order[np.maximum(bin_index, 0)] if len(self.bin_list) > 0 else bin_index
+        result = np.zeros(xs.shape, dtype=np.float32)
+        result[inside] = self.values[bin_index[inside], row[inside], col[inside]]
+        return result
+
+    def __getitem__(self, time_bin):
+        return DenseGridBin(self, self.bin_index[time_bin])
+
+    def __iter__(self):
+        return iter(self.bin_list)
+
+    def __len__(self):
+        return len(self.bin_list)
+
+class DenseGridBin(Mapping):
+    '''
+    the grid of one time bin of a DenseGrid, a dictionary of cell.bounds -> probability of the cell
+        iterating over it gives the cells with a non zero probability in cell_list order, like convert2DArr
+    '''
+
+    def __init__(self, dense_grid, index):
+        self.dense_grid = dense_grid
+        self.time_bin = dense_grid.bin_list[index]
+        self.array = dense_grid.values[index]
+
+    def value_at(self, xs, ys):
+        '''
+        the grid values under the points (xs, ys), 0 outside of the grid
+        '''
+        row, col, inside = self.dense_grid.pointToIndex(xs, ys)
+        result = np.zeros(row.shape, dtype=np.float32)
+        result[inside] = self.array[row[inside], col[inside]]
+        return result
+
+    @property
+    def pyramid(self):
+        '''the GridPyramid of this time bin'''
+        return self.dense_grid.pyramid(self.time_bin)
+
+    def cellValues(self):
+        '''
+        the probability of every cell in cell_list, as a numpy array
+        '''
+        return self.array[self.dense_grid.cell_row, self.dense_grid.cell_col]
+
+    def __getitem__(self, bounds):
+        i = self.dense_grid.bounds_index[bounds]
+        return float(self.array[self.dense_grid.cell_row[i], self.dense_grid.cell_col[i]])
+
+    def __iter__(self):
+        cell_bounds = self.dense_grid.cell_bounds
+        return (cell_bounds[i] for i in np.flatnonzero(self.cellValues()))
+
+    def __len__(self):
+        return int(np.count_nonzero(self.cellValues()))
+
+def poolGrid(grid, factor, pooling):
+    '''
+    a coarser grid whose cells are blocks of factor x factor cells of grid, the grid is padded with zeros to a multiple of factor
+
+    parameters:
+        grid: 2D numpy array
+        pooling: np.sum or np.max, how the cells of a block are put together
+    '''
+    num_rows = -(-grid.shape[0] // factor)
+    num_cols = -(-grid.shape[1] // factor)
+    padded = np.zeros((num_rows * factor, num_cols * factor), dtype = grid.dtype)
+    padded[:grid.shape[0], :grid.shape[1]] = grid
+    return pooling(padded.reshape(num_rows, factor, num_cols, factor), axis = (1, 3))
+
+class GridPyramid:
+    '''
+    coarse copies and a summed-area table of the grid of one time bin, so region queries do not scan the whole grid
+
+    levels: factor -> (sum of every factor x factor block, maximum of every block), for the factors in LEVELS
+    summed_area: summed_area[row, col] is the sum of all cells below row and left of col
+    '''
+    LEVELS = (1, 2, 4, 8)
+
+    def __init__(self, grid, minx, miny, cell_size, cell_values = None):
+        '''
+        parameters:
+            grid: 2D numpy array of the time bin, indexed by [row][col]
+            minx, miny: lower left corner of the grid
+            cell_size: cell size in meters
+            cell_values: (optional) values of the cells of the configuration space, for topSum, defaults to every cell of the grid
+        '''
+        self.grid = np.asarray(grid, dtype = float)
+        self.minx = minx
+        self.miny = miny
+        self.cell_size = cell_size
+
+        self.levels = {factor: (poolGrid(self.grid, factor, np.sum), poolGrid(self.grid, factor, np.max)) for factor in self.LEVELS}
+        self.summed_area = np.zeros((self.grid.shape[0] + 1, self.grid.shape[1] + 1))
+        self.summed_area[1:, 1:] = self.grid.cumsum(axis = 0).cumsum(axis = 1)
+        # sum of the n largest cell values is top_sums[n - 1]
+        cell_values = self.grid.ravel() if cell_values is None else np.asarray(cell_values, dtype = float)
+        self.top_sums = np.cumsum(np.sort(cell_values)[::-1])
+
+    def regionIndex(self, minx, miny, maxx, maxy):
+        '''
+        rows and cols (first, last + 1) of the cells that overlap the rectangle, clipped to the grid
+        '''
+        num_rows, num_cols = self.grid.shape
+        first_col = min(max(int(math.floor((minx - self.minx) / self.cell_size)), 0), num_cols)
+        first_row = min(max(int(math.floor((miny - self.miny) / self.cell_size)), 0), num_rows)
+        last_col = min(max(int(math.floor((maxx - self.minx) / self.cell_size)) + 1, 0), num_cols)
+        last_row = min(max(int(math.floor((maxy - self.miny) / self.cell_size)) + 1, 0), num_rows)
+        return first_row, last_row, first_col, last_col
+
+    def regionSum(self, minx, miny, maxx, maxy):
+        '''
+        total value of the cells that overlap the rectangle (minx, miny, maxx, maxy), from the summed-area table
+        '''
+        first_row, last_row, first_col, last_col = self.regionIndex(minx, miny, maxx, maxy)
+        if first_row >= last_row or first_col >= last_col:
+            return 0.0
+        return float(self.summed_area[last_row, last_col] - self.summed_area[first_row, last_col]\
+            - self.summed_area[last_row, first_col] + self.summed_area[first_row, first_col])
+
+    def bestCell(self, minx, miny, maxx, maxy):
+        '''
+        the cell with the largest value of all the cells that overlap the rectangle, None if no cell does
+
+        starts from the blocks of the coarsest level and only opens the blocks whose maximum is larger than
+            every cell found so far, so most of the region is never looked at cell by cell
+
+        output: (cell bounds, value), the bounds are the same tuple as cell.bounds
+        '''
+        first_row, last_row, first_col, last_col = self.regionIndex(minx, miny, maxx, maxy)
+        if first_row >= last_row or first_col >= last_col:
+            return None
+        factor = self.LEVELS[-1]
+        block_max = self.levels[factor][1]
+        heap = [(-block_max[row, col], factor, row, col) for row in range(first_row // factor, -(-last_row // factor))\
+            for col in range(first_col // factor, -(-last_col // factor))]
+        heapq.heapify(heap)
+        while heap:
+            value, factor, row, col = heapq.heappop(heap)
+            if factor == 1:
+                lowx = self.minx + col * self.cell_size
+                lowy = self.miny + row * self.cell_size
+                return ((lowx, lowy, lowx + self.cell_size, lowy + self.cell_size), -value)
+            # the blocks of the next level that are inside this block and overlap the region
+            child = self.LEVELS[self.LEVELS.index(factor) - 1]
+            ratio = factor // child
+            child_max = self.levels[child][1]
+            for child_row in range(max(row * ratio, first_row // child), min((row + 1) * ratio, -(-last_row // child))):
+                for child_col in range(max(col * ratio, first_col // child), min((col + 1) * ratio, -(-last_col // child))):
+                    heapq.heappush(heap, (-child_max[child_row, child_col], child, child_row, child_col))
+        return None
+
+    def topSum(self, n):
+        '''
+        sum of the n largest cell values, the same as sorting all the values and adding up the first n
+        '''
+        n = min(n, len(self.top_sums))
+        return float(self.top_sums[n - 1]) if n > 0 else 0.0
+
+class SharkOccupancyStream:
+    '''
+    builds the AUV detecting grids of a SharkOccupancyGrid from shark positions as they arrive, instead of from complete trajectories
+
+    the time bins are (i * bin_interval, (i + 1) * bin_interval) like createBinList, a time stamp on the edge between two bins
+        goes to the earlier bin like splitByTimeBin
+    only the bin of the latest position is open, the bins before it are frozen: their grids do not change any more
+        and positions that arrive late for them are dropped (counted in num_of_late)
+
+    the detecting grid is the occupancy grid summed over a disk (diskSum), which is linear, so for every open bin
+        the disk sum of the number of positions in each cell is kept for each shark, a new position only adds its disk to it
+        and the grid of the bin is put back together from these sums when it is asked for
+    once all the positions of the trajectories are added, the grids are the same as the ones convert constructs
+    '''
+
+    def __init__(self, sharkOccupancyGrid, shark_ids=()):
+        '''
+        parameters:
+            sharkOccupancyGrid: a SharkOccupancyGrid, its cells, bin_interval and detect_range are used
+            shark_ids: (optional) ids of all the sharks, the grid of a bin is the average over all the sharks,
+                sharks that show up later are added to the bins that are still open
+        '''
+        self.occupancy = sharkOccupancyGrid
+        self.shark_ids = set(shark_ids)
+        self.num_of_late = 0
+
+        offsets = np.array(diskOffsets(sharkOccupancyGrid.cell_size, sharkOccupancyGrid.detect_range)).reshape(-1, 2)
+        self.row_offsets = offsets[:, 0]
+        self.col_offsets = offsets[:, 1]
+        self.mask = np.zeros(sharkOccupancyGrid.cell_index_shape, dtype = bool)
+        self.mask[sharkOccupancyGrid.cell_row, sharkOccupancyGrid.cell_col] = True
+        # every cell starts with an occupancy of 0.01
+        self.prior_sum = diskSum(self.mask * 0.01, sharkOccupancyGrid.cell_size, sharkOccupancyGrid.detect_range)
+
+        # index of the open bin, None before the first position
+        self.open_bin = None
+        # open bins: index -> {shark id: number of positions}, {shark id: disk sum of the positions}
+        self.num_of_points = {}
+        self.point_sums = {}
+        # index -> AUV detecting grid, for the frozen bins and the open bins that have not changed since the grid was made
+        self.grids = {}
+
+    def timeBin(self, index):
+        return (index * self.occupancy.bin_interval, (index + 1) * self.occupancy.bin_interval)
+
+    def binIndex(self, times):
+        '''index of the time bin of each time stamp, a time on the edge between two bins goes to the earlier bin'''
+        times = np.asarray(times, dtype = float)
+        return np.maximum(np.ceil(times / self.occupancy.bin_interval).astype(int) - 1, 0)
+
+    def addSharkPositions(self, shark_id, traj):
+        '''
+        add new positions of a shark, the positions are expected to arrive roughly in time order
+
+        parameters:
+            shark_id: id of the shark
+            traj: a list of Motion_plan_state with traj_time_stamp, the new positions of the shark
+
+        output: a list of the time bins whose grids changed
+        '''
+        if shark_id not in self.shark_ids:
+            self.shark_ids.add(shark_id)
+            # the average of the open bin is over one more shark
+            self.grids.pop(self.open_bin, None)
+        traj = [mps for mps in traj if mps.traj_time_stamp >= 0]
+        if len(traj) == 0:
+            return []
+        bin_index = self.binIndex([mps.traj_time_stamp for mps in traj])
+        if self.open_bin is None or bin_index.max() > self.open_bin:
+            self.freeze(bin_index.max())
+
+        late = bin_index < self.open_bin
+        self.num_of_late += int(np.count_nonzero(late))
+        positions = self.occupancy.pointsToCells([mps.x for mps in traj], [mps.y for mps in traj])
+        changed = []
+        for index in np.unique(bin_index[~late]):
+            in_bin = ~late & (bin_index == index)
+            self.addPoints(index, shark_id, positions[in_bin])
+            changed.append(self.timeBin(index))
+        return changed
+
+    def addPoints(self, index, shark_id, positions):
+        '''add the disks of the points at positions (in cell_list, -1 outside of every cell) to the sums of a shark in an open bin'''
+        shape = self.occupancy.cell_index_shape
+        num_of_points = self.num_of_points.setdefault(index, {})
+        point_sums = self.point_sums.setdefault(index, {})
+        # points outside of every cell still count in the normalize factor
+        num_of_points[shark_id] = num_of_points.get(shark_id, 0) + len(positions)
+        positions = positions[positions >= 0]
+        rows = (self.occupancy.cell_row[positions][:, None] - self.row_offsets).ravel()
+        cols = (self.occupancy.cell_col[positions][:, None] - self.col_offsets).ravel()
+        inside = (rows >= 0) & (rows < shape[0]) & (cols >= 0) & (cols < shape[1])
+        disks = np.bincount(rows[inside] * shape[1] + cols[inside], minlength = shape[0] * shape[1]).reshape(shape)
+        point_sums[shark_id] = point_sums.get(shark_id, 0) + disks
+        self.grids.pop(index, None)
+
+    def freeze(self, open_bin):
+        '''open the bin open_bin, the grids of all the bins before it are made and the sums of their positions are dropped'''
+        for index in [index for index in self.num_of_points if index < open_bin]:
+            self.grids[index] = self.makeGrid(index)
+            del self.num_of_points[index]
+            del self.point_sums[index]
+        self.open_bin = open_bin
+
+    def makeGrid(self, index):
+        '''the AUV detecting grid of an open bin, the average over all the sharks of the disk sums of their occupancy grids'''
+        num_of_cells = len(self.occupancy.cell_row)
+        num_of_points = self.num_of_points.get(index, {})
+        point_sums = self.point_sums.get(index, {})
+        grid = np.zeros(self.occupancy.cell_index_shape)
+        prior_weight = 0
+        for shark_id in self.shark_ids:
+            # same normalize factor as constructSharkOccupancyGrid
+            nor = num_of_points.get(shark_id, 0) + num_of_cells * 0.01
+            prior_weight += 1 / nor
+            if shark_id in point_sums:
+                grid += point_sums[shark_id] / nor
+        grid += self.prior_sum * prior_weight
+        grid[~self.mask] = 0
+        return grid / max(len(self.shark_ids), 1)
+
+    def grid(self, time_bin):
+        '''
+        the AUV detecting grid of a time bin as a numpy array, None for the bins after the open bin
+            a bin without positions has the grid of sharks that can be anywhere, like in convert
+        '''
+        index = int(round(time_bin[0] / self.occupancy.bin_interval))
+        if self.open_bin is None or index < 0 or index > self.open_bin:
+            return None
+        if index not in self.grids:
+            self.grids[index] = self.makeGrid(index)
+        return self.grids[index]
+
+    def currentGrid(self):
+        '''
+        returns (time bin, AUV detecting grid) of the open bin, the grid is only made again if positions were added since the last call
+        '''
+        if self.open_bin is None:
+            return None
+        time_bin = self.timeBin(self.open_bin)
+        return (time_bin, self.grid(time_bin))
+
+    def denseGrid(self):
+        '''
+        a DenseGrid of the grids of all the bins up to the open bin, for the planners and cost functions
+        '''
+        if self.open_bin is None:
+            return DenseGrid(np.zeros((0,) + self.occupancy.cell_index_shape), [], self.occupancy.boundary,\
+                self.occupancy.cell_size, self.occupancy.cell_list)
+        bin_list = [self.timeBin(index) for index in range(self.open_bin + 1)]
+        return DenseGrid([self.grid(time_bin) for time_bin in bin_list], bin_list, self.occupancy.boundary,\
+            self.occupancy.cell_size, self.occupancy.cell_list)
 
 # boundary_poly = []
 # for b in catalina.BOUNDARIES:
@@ -0,0 +1,144 @@
+"""
+Resampling schemes for the particle filter
+
+Every function takes an array of particle weights (they do not have to add up to 1)
+    and returns an array of particle indices, so the surviving particles can be gathered
+    with a single fancy-indexing call instead of copying particle objects
+
+The weights can also be a 2D array with one row of particles per shark,
+    in which case every row is resampled on its own and the indices are per row
+"""
+import numpy as np
+
+def effective_sample_size(weights):
+    """
+    Return the effective sample size (1 / sum of squared normalized weights) of the particles
+        it is equal to the number of particles when all the weights are the same,
+        and gets close to 1 when a single particle holds all of the weight
+
+    Parameter:
+        weights - numpy array of particle weights
+    """
+    weights = np.asarray(weights, dtype = float)
+    weights = weights / weights.sum()
+    return 1.0 / np.dot(weights, weights)
+
+def systematic_resample(weights, num_of_samples = None, rng = np.random):
+    """
+    Low variance resampling: a single random offset is drawn and the samples are taken 
+        at evenly spaced positions along the cumulative weights
+
+    Parameter:
+        weights - numpy array of particle weights
+        num_of_samples - (optional) number of indices to return, defaults to the number of particles
+        rng - (optional) random number generator, anything with a random(size) function
+    """
+    weights = np.asarray(weights, dtype = float)
+    num_of_samples = weights.shape[-1] if num_of_samples is None else num_of_samples
+    positions = (np.arange(num_of_samples) + rng.random(weights.shape[:-1] + (1,))) / num_of_samples
+    return _search_cumulative_weights(weights, positions)
+
+def stratified_resample(weights, num_of_samples = None, rng = np.random):
+    """
+    Stratified resampling: the cumulative weights are split into num_of_samples equal strata
+        and one random sample is taken inside every stratum
+
+    Parameter:
+        weights - numpy array of particle weights
+        num_of_samples - (optional) number of indices to return, defaults to the number of particles
+        rng - (optional) random number generator, anything with a random(size) function
+    """
+    weights = np.asarray(weights, dtype = float)
+    num_of_samples = weights.shape[-1] if num_of_samples is None else num_of_samples
+    positions = (np.arange(num_of_samples) + rng.random(weights.shape[:-1] + (num_of_samples,))) / num_of_samples
+    return _search_cumulative_weights(weights, positions)
+
+def residual_resample(weights, num_of_samples = None, rng = np.random):
+    """
+    Residual resampling: every particle is first kept floor(num_of_samples * weight) times, 
+        then the rest of the samples are drawn from the leftover weights
+
+    Parameter:
+        weights - numpy array of particle weights
+        num_of_samples - (optional) number of indices to return, defaults to the number of particles
+        rng - (optional) random number generator, anything with a random(size) function
+    """
+    weights = np.asarray(weights, dtype = float)
+    if weights.ndim == 2:
+        return np.array([residual_resample(row, num_of_samples, rng) for row in weights])
+    num_of_samples = len(weights) if num_of_samples is None else num_of_samples
+    scaled_weights = num_of_samples * weights / weights.sum()
+    num_of_copies = np.floor(scaled_weights).astype(int)
+    indices = np.repeat(np.arange(len(weights)), num_of_copies)
+
+    num_of_residuals = num_of_samples - len(indices)
+    if num_of_residuals > 0:
+        positions = np.sort(rng.random(num_of_residuals))
+        residual_indices = _search_cumulative_weights(scaled_weights - num_of_copies, positions)
+        indices = np.concatenate((indices, residual_indices))
+    return indices
+
+def _search_cumulative_weights(weights, positions):
+    """
+    Return the index of the particle whose cumulative weight range contains each position in [0, 1)
+
+    For 2D weights every row is shifted by its row number, so all of the rows are searched
+        with a single searchsorted call on the flattened cumulative weights
+    """
+    cumulative_weights = np.cumsum(weights, axis = -1, dtype = float)
+    cumulative_weights /= cumulative_weights[..., -1:]
+    num_of_particles = cumulative_weights.shape[-1]
+    if cumulative_weights.ndim == 1:
+        indices = np.searchsorted(cumulative_weights, positions, side = 'right')
+        return np.minimum(indices, num_of_particles - 1)
+
+    row_offset = np.arange(cumulative_weights.shape[0])[:, np.newaxis]
+    indices = np.searchsorted((cumulative_weights + row_offset).ravel(), (positions + row_offset).ravel(), side = 'right')
+    indices = indices.reshape(positions.shape) - row_offset * num_of_particles
+    return np.clip(indices, 0, num_of_particles - 1)
+
+def kld_sample_size(num_of_bins, epsilon = 0.05, z_quantile = 2.326):
+    """
+    KLD-sampling bound (Fox 2003): the number of particles needed so that, with probability 1 - delta,
+        the distance between the particle approximation and the true posterior is below epsilon
+        when the particles occupy num_of_bins histogram bins
+
+    Parameter:
+        num_of_bins - number of histogram bins that contain at least one particle
+        epsilon - (optional) the allowed error, a smaller value means more particles
+        z_quantile - (optional) upper 1 - delta quantile of the standard normal distribution (2.326 for delta = 0.01)
+    """
+    if num_of_bins <= 1:
+        return 1
+    k = num_of_bins - 1
+    a = 2.0 / (9.0 * k)
+    return int(np.ceil(k / (2.0 * epsilon) * (1.0 - a + np.sqrt(a) * z_quantile)**3))
+
+def count_occupied_bins(x, y, bin_size):
+    """
+    Return the number of bin_size x bin_size squares that contain at least one of the points
+
+    Parameter:
+        x, y - numpy arrays with the coordinates of the points
+        bin_size - side length of the squares
+    """
+    bins = np.floor(np.column_stack((np.ravel(x), np.ravel(y))) / bin_size).astype(np.int64)
+    return len(np.unique(bins, axis = 0))
+
+RESAMPLE_METHODS = {
+    "systematic": systematic_resample,
+    "stratified": stratified_resample,
+    "residual": residual_resample,
+}
+
+def resample(weights, method = "systematic", num_of_samples = None, rng = np.random):
+    """
+    Return the indices of the resampled particles
+
+    Parameter:
+        weights - numpy array of particle weights
+        method - a string, either "systematic", "stratified" or "residual"
+        num_of_samples - (optional) number of indices to return, defaults to the number of particles
+        rng - (optional) random number generator, anything with a random(size) function
+    """
+    return RESAMPLE_METHODS[method](weights, num_of_samples, rng)
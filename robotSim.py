@@ -16,7 +16,7 @@ from sharkTrajectory import SharkTrajectory
 from live3DGraph import Live3DGraph
 from motion_plan_state import Motion_plan_state
 from auv import Auv
-from particleFilter import ParticleFilter
+from particleFilter import ParticleFilter, MultiSharkParticleFilter, ParticleFilterWorker
 
 #import path planning class
 from path_planning.astar import astar
@@ -93,6 +93,10 @@ class RobotSim:
         #time limit for path planning algorithm to find the shortest path
         self.planning_time = planning_time
 
+        # (optional) a MeasurementRecorder, which saves every measurement that the particle filter gets,
+        #   so the run can be replayed with measurementLog.replay
+        self.measurement_recorder = None
+
 
     def get_auv_state(self):
         """
@@ -661,8 +665,10 @@ class RobotSim:
             test_particle = self.filter_dict[filter]
             # dictionary for range and bearings
             measurement_data_dict = {}
-            #created particles
-            particles = test_particle.create()
+            # the filter creates its particles and updates them in a background thread,
+            #   so a slow update does not hold up the navigation loop
+            filter_worker = ParticleFilterWorker(test_particle, start_time = self.curr_time)
+            filter_worker.start()
             while self.live_graph.run_sim:
                 print("current time")
                 print(self.curr_time)
@@ -672,33 +678,31 @@ class RobotSim:
                 final_auv_z_array = []
                 final_obstacle_array = []
                 final_particle_array = []
-                # update particles
-                particles = test_particle.create_and_update(particles)
                 shark_state_dict = self.get_all_sharks_state()
 
                 all_auvs_range_bearing_dict = []
                 measurement_dict_list = []
                 auv_index = -1
+                has_new_data = False
                 for auv in sorted(self.auv_dict):
                     auv_index += 1
                     test_auv = self.auv_dict[auv]
                     auv_sensor_data = self.auv_dict[auv].get_auv_sensor_measurements(self.curr_time)
                     measurement_dict_list.append(test_auv.get_all_sharks_sensor_measurements(shark_state_dict, auv_sensor_data))
-                    # updates the particleFitlers's auv x and y 
-                final_measurement_dict_list = []
-                # this makes sure that the particleFitler is only getting range and bearing information from the first shark
-                for measurement in measurement_dict_list:
-                    final_measurement_dict_list.append(measurement[0])
-                # update particleFilter shark's x and y positions, will change this after, need shark coordinates to update in order to calculate range error 
-
-                for measurement in final_measurement_dict_list:
-                    test_particle.x_shark = measurement[0]
-                    test_particle.y_shark = measurement[1]
-                    
-                particles = test_particle.update_weights(particles,final_measurement_dict_list)
+                    # the auv resets its sensor time when it returns a new set of measurements
+                    has_new_data = has_new_data or test_auv.sensor_time == 0
+                if has_new_data:
+                    if self.measurement_recorder is not None:
+                        self.measurement_recorder.record_all(self.curr_time, sorted(self.auv_dict), measurement_dict_list)
+                    # every auv's measurements of every shark are used in a single update
+                    filter_worker.add_measurements(self.curr_time, measurement_dict_list)
                 
-                xy_mean = test_particle.particleMean(particles)
-                range_error = test_particle.meanError(xy_mean[0], xy_mean[1])
+                # the newest estimate, without waiting for the update that is running
+                posterior = filter_worker.latest_snapshot()
+                # the error only uses the snapshot, the filter thread keeps changing the filter's own shark positions
+                range_error = posterior.meanError()
+                print("error")
+                print(range_error)
 
                 for auv in sorted(self.auv_dict):
                     test_auv = self.auv_dict[auv]
@@ -769,7 +773,7 @@ class RobotSim:
 
                     # testing data for displaying particle array
                     
-                    particle_array = particles
+                    particle_array = posterior.particles
 
                     # example of first parameter to update_live_graph function
                     planned_traj_array = [["A *", A_star_traj], ["RRT", RRT_traj]]
@@ -797,6 +801,8 @@ class RobotSim:
                 if terminate_loop:
                     self.live_graph.run_sim = False
                     break
+
+            filter_worker.stop()
                     
             obstacle_array = [Motion_plan_state(757,243, size=10), Motion_plan_state(763,226, size=15)]
             self.live_graph.plot_2d_sim_graph(final_auv_x_array, final_auv_y_array, obstacle_array)
@@ -832,10 +838,11 @@ def main():
     test_robot.setup("./data/shark_tracking_data_x.csv", "./data/shark_tracking_data_y.csv", [1,2])
     shark_state_dict = test_robot.get_all_sharks_state()
     # create a dictionary of all the particleFilters
-    shark_state = shark_state_dict[1]
     auv_state = [test_robot.auv_dict[1], test_robot.auv_dict[2]]
     #list of auv objects 
-    test_robot.filter_dict[0] = ParticleFilter(shark_state.x, shark_state.y, auv_state)
+    # one filter tracks all of the sharks at once, it starts with many particles to find the sharks
+    #   and uses fewer particles once the estimates converge
+    test_robot.filter_dict[0] = MultiSharkParticleFilter(shark_state_dict, auv_state, num_of_particles = 20000, min_particles = 500, max_particles = 50000)
     
     test_robot.main_navigation_loop()
 
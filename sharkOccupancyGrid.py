@@ -10,6 +10,9 @@ import time
 
 import catalina
 from motion_plan_state import Motion_plan_state
+# the grids are shared with the path planning copy of SharkOccupancyGrid, which constructs them the same way
+from path_planning.sharkOccupancyGrid import GridCache, gridCacheKey, DenseGrid, constructGrids, timeBinned, CellIndex, diskSum,\
+    RasterCell, CellRaster, pointsInPolygon, splitCell, binTimes, splitByTimeBin
 
 class SharkOccupancyGrid:
     '''
@@ -40,17 +43,29 @@ class SharkOccupancyGrid:
         self.detect_range = detect_range
         self.boundary = boundary
 
+        self.buildCellIndex()
+
         self.bin_list = self.createBinList()
     
-    def convert(self):
+    def convert(self, cache=True, num_of_processes=1):
         '''
         convert a dictionary of shark trajectories
             key: shark ID, int
             value: shark trajectory, a list of Motion_plan_state
+
+        the grids are only constructed the first time a set of shark trajectories is converted with the same
+            boundary, cell_size, bin_interval and detect_range, after that they are read from the grid cache
         
-        output: 
-        sharkOccupancy:
-            a dictionary of shark occupancy grid maps
+        cache: (optional) True to use the cache in GRID_CACHE_DIR, a GridCache to use another cache, False to always construct the grids
+        num_of_processes: (optional) the time bins are constructed in a pool of this many processes, None for the number of cpus
+
+        output: (resultArr, resultCell)
+        resultArr:
+            a dictionary of AUV detecting grids
+                key: timebin, tuple(start time, end time)
+                value: the grid during this time bin, a 2D list indexed by [row][col]
+        resultCell:
+            a DenseGrid of the same grids, which can be used as a dictionary of shark occupancy grid maps
                 key: timebin, tuple(start time, end time)
                 value: a dictionary representing occupancy grid of each shark during this time bin
         '''
@@ -58,60 +73,30 @@ class SharkOccupancyGrid:
         #convert to a dictionary, whose key is time bin
         self.timeBinDict = self.convertToTimeBin()
 
+        if cache:
+            grid_cache = cache if isinstance(cache, GridCache) else GridCache()
+            key = gridCacheKey(self.data, self.boundary, self.cell_size, self.bin_interval, self.detect_range, self.cell_row, self.cell_col)
+            if key not in grid_cache:
+                grid_cache.save(key, list(self.timeBinDict.keys()), constructGrids(self, self.timeBinDict.values(), num_of_processes))
+            bin_list, grids = grid_cache.loadArrays(key)
+            return (grid_cache.load(key, lambda grid: grid.tolist()), DenseGrid(grids, bin_list, self.boundary, self.cell_size, self.cell_list))
+
+        grids = constructGrids(self, self.timeBinDict.values(), num_of_processes)
         resultArr = {}
-        resultCell = {}
-        for time, traj_dict in self.timeBinDict.items():
-            grid = self.constructGrid(traj_dict)
+        for time, grid in zip(self.timeBinDict.keys(), grids):
             # grid = self.simplifyGrid(grid)
-            resultArr[time] = grid
-            resultCell[time] = self.convert2DArr(grid)
-        return (resultArr, resultCell)
+            resultArr[time] = grid.tolist()
+        return (resultArr, DenseGrid(grids, list(resultArr.keys()), self.boundary, self.cell_size, self.cell_list))
 
     def splitCell(self, geometry, count=0):
-        """Split a Polygon into two parts across it's shortest dimension
+        """split a Polygon into cells of cell_size, returns a CellRaster
         
         parameter:
             geometry: the polygon of configuration space to be splitted into cells
             
-        output: a list of Polygon objects, represented cells in the configuration space
+        output: a CellRaster, which can be used as a list of the cells in the configuration space
         """
-        bounds = geometry.bounds
-        width = bounds[2] - bounds[0]
-        height = bounds[3] - bounds[1]
-
-        if max(width, height) <= self.cell_size or count == 250:
-            # either the polygon is smaller than the cell size, or the maximum
-            # number of recursions has been reached
-            return [geometry]
-
-        if height >= width:
-            # split left to right
-            a = box(bounds[0], bounds[1], bounds[2], bounds[1]+height/2)
-            b = box(bounds[0], bounds[1]+height/2, bounds[2], bounds[3])
-        else:
-            # split top to bottom
-            a = box(bounds[0], bounds[1], bounds[0]+width/2, bounds[3])
-            b = box(bounds[0]+width/2, bounds[1], bounds[2], bounds[3])
-
-        result = []
-        for d in (a, b,):
-            c = geometry.intersection(d)
-            if not isinstance(c, GeometryCollection):
-                c = [c]
-            for e in c:
-                if isinstance(e, (Polygon, MultiPolygon)):
-                    result.extend(self.splitCell(e, count+1))
-        if count > 0:
-            return result
-
-        # convert multipart into singlepart
-        final_result = []
-        for g in result:
-            if isinstance(g, MultiPolygon):
-                final_result.extend(g)
-            else:
-                final_result.append(g)
-        return final_result
+        return splitCell(geometry, self.cell_size)
     
     def constructGrid(self, shark_traj_dict):
         '''
@@ -149,7 +134,8 @@ class SharkOccupancyGrid:
             the probability it can detect this shark
             calculated by the sum of shark occupancy of all nearby cells within hydrophone range
         
-        for each cell in the work space, sum up the occupancy of cells within detect_range if AUV resides in this cell
+        for each cell in the work space, sum up the occupancy of cells within detect_range if AUV resides in this cell,
+            which is the occupancy grid convolved with a disk of radius detect_range (in cells)
 
         parameter:
             occGrid: occupancy grid for a single shark during one time bin
@@ -157,21 +143,14 @@ class SharkOccupancyGrid:
         output: an AUV detecting grid representing AUV detecting probability of each cell
             note: AUV detecting probability of each cell should be no larger than 1
         '''
-        minx, miny, maxx, maxy = self.boundary.bounds
-        grid = [[0 for _ in range(int(math.ceil(maxx - minx) / self.cell_size)+1)] for _ in range(int(math.ceil(maxy - miny) / self.cell_size)+1)]
-        count = int(math.ceil(self.detect_range / self.cell_size))
-        for cell in self.cell_list:
-            row, col = self.cellToIndex(cell)
-            row_min, col_min = row - count, col - count
-            for i in range(2 * count):
-                row_temp = row_min + i
-                for j in range(2 * count):
-                    col_temp = col_min + j
-                    if row_temp >=0 and row_temp < len(grid) and col_temp >= 0 and col_temp < len(grid[0]):
-                        grid[row][col] += occGrid[row_temp][col_temp]
-            if grid[row][col] > 1:
-                print("problem!", grid[row][col])
-        return grid
+        grid = diskSum(occGrid, self.cell_size, self.detect_range)
+        # only the cells inside the boundary have a detecting probability
+        mask = np.zeros(grid.shape, dtype = bool)
+        mask[self.cell_row, self.cell_col] = True
+        grid[~mask] = 0
+        if (grid > 1 + 1e-9).any():
+            print("problem!", grid.max())
+        return grid.tolist()
     
     def constructSharkOccupancyGrid(self, traj):
         '''
@@ -186,46 +165,49 @@ class SharkOccupancyGrid:
             an occupancy grid representing the occupancy of this shark at each cell during the time bin
         '''
         #initialize the grid, probability initialized to 0.01
-        minx, miny, maxx, maxy = self.boundary.bounds
-        grid = [[0 for _ in range(int(math.ceil(maxx - minx) / self.cell_size)+1)] for _ in range(int(math.ceil(maxy - miny) / self.cell_size)+1)]
-        for cell in self.cell_list:
-            row, col = self.cellToIndex(cell)
-            grid[row][col] = 0.01
+        grid = np.zeros(self.cell_index_shape)
+        grid[self.cell_row, self.cell_col] = 0.01
         
         #normalize factor
-        nor = (len(traj) + len(self.cell_list) * 0.01)
+        nor = (len(traj) + len(self.cell_row) * 0.01)
 
-        #calculate occupancy probability
-        for point in traj:
-            for cell in self.cell_list:
-                point = Point(point.x, point.y)
-                if point.within(cell) or cell.touches(point):
-                    row, col = self.cellToIndex(cell)
-                    grid[row][col] += 1
-                    break
-        
-        temp_sum = 0
-        for i in range(len(grid)):
-            for j in range(len(grid[i])):
-                grid[i][j] = grid[i][j] / nor
-                temp_sum += grid[i][j]
-        # print(temp_sum)
-        return grid
+        #calculate occupancy probability, count the points in each cell with one histogram
+        positions = self.pointsToCells([point.x for point in traj], [point.y for point in traj])
+        positions = positions[positions >= 0]
+        grid += np.bincount(self.cell_slot[positions], minlength = grid.size).reshape(grid.shape)
+
+        return (grid / nor).tolist()
+
+    def buildCellIndex(self):
+        '''
+        index the cells in cell_list with a CellIndex, so points can be put in cells with arithmetic instead of testing every cell
+
+        sets:
+            cell_index: the CellIndex
+            cell_index_shape, cell_row, cell_col, cell_slot: the shape, cell_row, cell_col and cell_slot of cell_index
+        '''
+        self.cell_index = CellIndex(self.cell_list, self.boundary, self.cell_size)
+        self.cell_index_shape = self.cell_index.shape
+        self.cell_row = self.cell_index.cell_row
+        self.cell_col = self.cell_index.cell_col
+        self.cell_slot = self.cell_index.cell_slot
+
+    def pointsToCells(self, x, y):
+        '''
+        find the cell that contains each point with CellIndex.pointsToCells, 
+            a point on the edge between cells goes to the cell that comes first in cell_list
+
+        output: a numpy array of positions in cell_list, -1 for points that are not in any cell
+        '''
+        return self.cell_index.pointsToCells(x, y)
 
     def splitTraj(self, traj):
         '''
         split trajectory based on time bin
-        '''
-        #initialize 
-        new_traj = [[self.bin_list[i]] for i in range(len(self.bin_list))]
 
-        for point in traj:
-            time = point.traj_time_stamp
-            for i in range(len(self.bin_list)):
-                if time >= self.bin_list[i][0] and time <=  self.bin_list[i][1]:
-                    new_traj[i].append(point)
-                    break
-        return new_traj
+        output: a list, one element per time bin: [time bin, points in the time bin...]
+        '''
+        return [[time_bin] + points for time_bin, points in zip(self.bin_list, splitByTimeBin(traj, self.bin_list))]
 
     def convertToTimeBin(self):
         '''
@@ -245,9 +227,8 @@ class SharkOccupancyGrid:
             result[item] = {}
         
         for shark, traj in self.data.items():
-            new_traj_list = self.splitTraj(traj)
-            for new_traj in new_traj_list:
-                result[new_traj[0]][shark] = new_traj[1:]
+            for time_bin, points in zip(self.bin_list, splitByTimeBin(traj, self.bin_list)):
+                result[time_bin][shark] = points
 
         return result
     
@@ -264,8 +245,9 @@ class SharkOccupancyGrid:
     def cellToIndex(self, cell):
         minx, miny, _, _ = self.boundary.bounds
         lowx, lowy, _, _ = cell.bounds
-        col = int((lowx - minx) / self.cell_size)
-        row = int((lowy - miny) / self.cell_size)
+        # the small offset keeps a cell whose corner is one rounding error below a grid line in the right column / row
+        col = int(math.floor((lowx - minx) / self.cell_size + 1e-9))
+        row = int(math.floor((lowy - miny) / self.cell_size + 1e-9))
         return (row, col)
 
     def indexToCell(self, row, col):
@@ -333,26 +315,6 @@ class SharkOccupancyGrid:
         plt.legend(loc="lower right")
         plt.show()
 
-def splitCell(polygon, cell_size):
-    minx, miny, maxx, maxy = polygon.bounds
-    horizontal_splitters = []
-    while (miny + cell_size) <= maxy:
-        horizontal_splitters.append(LineString([(minx, miny + cell_size), (maxx, miny + cell_size)]))
-        miny = miny + cell_size
-    vertical_splitters = []
-    minx, miny, maxx, maxy = polygon.bounds
-    while (minx + cell_size) <= maxx:
-        vertical_splitters.append(LineString([(minx + cell_size, miny), (minx + cell_size, maxy)]))
-        minx += cell_size
-
-    splitters = horizontal_splitters + vertical_splitters
-    result = polygon
-    for splitter in splitters:
-        result = MultiPolygon(split(result, splitter))
-        
-    return result
-        
-
 
 # boundary_poly = []
 # for b in catalina.BOUNDARIES: